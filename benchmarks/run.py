@@ -0,0 +1,292 @@
+"""
+BENCHMARKS FOR TKEDIT
+Times the editor's hot paths on synthetic files and writes the results as JSON.
+
+Usage:
+    python -m benchmarks.run [--lines N] [--repeat N] [--only NAME ...] [--output results.json]
+                             [--baseline baseline.json] [--threshold 0.2]
+
+Run from the root of the repository. If there is no X display, a virtual one is started with Xvfb.
+With --baseline, the median of every benchmark is compared to the one stored in the baseline file, and the exit
+status is 1 if any of them got slower by more than the threshold (0.2 = 20%). It is also 1 if any benchmark failed.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tkinter as tk
+
+from benchmarks import synthetic
+from dialogs.find_and_replace import FindAndReplaceWin
+from syntax_highlighting.python import PythonSyntaxHighlighter
+from tkEdit import Main
+import utils
+
+
+class VirtualDisplay:
+    """Runs an Xvfb server for as long as it's used as a context manager"""
+    def __init__(self):
+        self.process = None
+        self.display = None
+
+    def __enter__(self):
+        if shutil.which('Xvfb') is None:
+            raise RuntimeError('No X display is available and Xvfb is not installed')
+        number = 99
+        while os.path.exists(f'/tmp/.X{number}-lock'):
+            number += 1
+        self.display = f':{number}'
+        self.process = subprocess.Popen(['Xvfb', self.display, '-screen', '0', '1280x1024x24', '-nolisten', 'tcp'],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(100):
+            if os.path.exists(f'/tmp/.X11-unix/X{number}'):
+                break
+            time.sleep(0.05)
+        os.environ['DISPLAY'] = self.display
+        return self
+
+    def __exit__(self, *args):
+        self.process.terminate()
+        self.process.wait()
+
+
+class Benchmarks:
+    """
+    The benchmarks themselves. Every bench_ method returns a list of (name, setup, run) tuples, where setup() is
+    called before each timed run() and isn't part of the timing
+    """
+    def __init__(self, directory, lines):
+        self.directory = directory
+        self.lines = lines
+        self.files = {kind: synthetic.write_file(os.path.join(directory, f'sample.{kind}'), kind, lines)
+                      for kind in synthetic.GENERATORS}
+        self.texts = {}
+        for kind, path in self.files.items():
+            with open(path) as file:
+                self.texts[kind] = file.read()
+        self.main = None
+        # Editors created by the startup benchmark
+        self._roots = []
+
+    def get_main(self):
+        if self.main is None:
+            self.main = Main()
+            self.main.update()
+        return self.main
+
+    def set_text(self, kind):
+        main = self.get_main()
+        main.set_syntax_highlighter(None)
+        main.editor.stop_journal(delete=True)
+        main.editor.delete('1.0', 'end')
+        main.editor.insert('1.0', self.texts[kind])
+        main.editor.edit_reset()
+        main.editor.edit_modified(False)
+        main.update()
+
+    def close(self):
+        while self._roots:
+            self._roots.pop().destroy()
+        if self.main is not None:
+            self.main.destroy()
+            self.main = None
+
+    def bench_startup(self):
+        def run():
+            root = Main()
+            root.update()
+            self._roots.append(root)
+
+        def setup():
+            while self._roots:
+                self._roots.pop().destroy()
+        return [('startup.Main', setup, run)]
+
+    def bench_highlight(self):
+        highlighter = None
+
+        def setup():
+            nonlocal highlighter
+            self.set_text('py')
+            editor = self.get_main().editor
+            highlighter = PythonSyntaxHighlighter(editor)
+            for tag in highlighter.get_tag_names():
+                editor.tag_remove(tag, '1.0', 'end')
+            highlighter._start = '1.0'
+            highlighter._stop = 'end'
+            highlighter._text = editor.get('1.0', 'end')
+
+        def run():
+            highlighter.highlight_syntax()
+            self.get_main().update_idletasks()
+        return [('highlight.PythonSyntaxHighlighter.highlight_syntax', setup, run)]
+
+    def bench_get_string_indexes(self):
+        def run():
+            utils.get_string_indexes('\\mdolor\\M', self.get_main().editor, regex=True)
+        return [('utils.get_string_indexes', lambda: self.set_text('txt'), run)]
+
+    def bench_find_and_replace(self):
+        state = {}
+
+        def setup():
+            if 'window' in state:
+                state['window'].destroy()
+            self.set_text('log')
+            state['window'] = tk.Toplevel(self.get_main())
+            state['dialog'] = FindAndReplaceWin(state['window'], self.get_main().editor)
+            state['dialog'].find_entry.insert(0, 'ERROR')
+            state['dialog'].replace_entry.insert(0, 'FAILURE')
+
+        def setup_replace():
+            setup()
+            state['dialog'].find_all()
+
+        def find_all():
+            state['dialog'].find_all()
+            self.get_main().update_idletasks()
+
+        def replace_all():
+            state['dialog'].replace_all()
+            self.get_main().update_idletasks()
+        return [('find_and_replace.FindAndReplaceWin.find_all', setup, find_all),
+                ('find_and_replace.FindAndReplaceWin.replace_all', setup_replace, replace_all)]
+
+    def bench_open_file(self):
+        benches = []
+        for kind, path in self.files.items():
+            def run(path=path):
+                main = self.get_main()
+                main.file_menu.load_file(path)
+                while main.file_menu.is_loading():
+                    main.update()
+            benches.append((f'file_menu.FileMenu.load_file[{kind}]', lambda: self.set_text('txt'), run))
+        return benches
+
+    def bench_save_file(self):
+        path = os.path.join(self.directory, 'saved.py')
+
+        def setup():
+            self.set_text('py')
+            file_menu = self.get_main().file_menu
+            file_menu.filepath = path
+            file_menu.filename = os.path.split(path)[-1]
+
+        def run():
+            file_menu = self.get_main().file_menu
+            file_menu._save_file()
+            file_menu.wait_for_save()
+        return [('file_menu.FileMenu._save_file', setup, run)]
+
+    def all(self):
+        return [bench for name in dir(self) if name.startswith('bench_') for bench in getattr(self, name)()]
+
+
+def measure(setup, run, repeat):
+    times = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {'median': statistics.median(times), 'min': min(times), 'runs': times}
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints how each result compares to the baseline. Returns the names of the benchmarks that regressed
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f'{name:60} {result["median"] * 1000:10.2f} ms   (not in baseline)')
+            continue
+        before = baseline[name]['median']
+        change = (result['median'] - before) / before if before else 0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:60} {result["median"] * 1000:10.2f} ms   {change:+.1%}{flag}')
+    return regressions
+
+
+def run_benchmarks(args):
+    """
+    Runs the benchmarks. Returns the results by name and the names of the benchmarks that failed
+    """
+    results = {}
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        # The editor keeps its settings and recent files in the working directory
+        os.chdir(directory)
+        benchmarks = Benchmarks(directory, args.lines)
+        try:
+            for name, setup, run in benchmarks.all():
+                if args.only and not any(part in name for part in args.only):
+                    continue
+                try:
+                    results[name] = measure(setup, run, args.repeat)
+                except Exception as e:
+                    # One broken benchmark shouldn't stop the others from running
+                    failures.append(name)
+                    print(f'{name:60} FAILED: {e!r}', file=sys.stderr)
+                    continue
+                print(f'{name:60} {results[name]["median"] * 1000:10.2f} ms', file=sys.stderr)
+        finally:
+            benchmarks.close()
+            os.chdir(cwd)
+    return results, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for tkEdit')
+    parser.add_argument('--lines', type=int, default=20000, help='number of lines in the synthetic files')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs of each benchmark')
+    parser.add_argument('--only', nargs='*', help='only run benchmarks whose names contain one of these')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='slowdown relative to the baseline that counts as a regression')
+    args = parser.parse_args()
+
+    if os.environ.get('DISPLAY') or sys.platform in ('win32', 'darwin'):
+        results, failures = run_benchmarks(args)
+    else:
+        with VirtualDisplay():
+            results, failures = run_benchmarks(args)
+
+    output = {
+        'meta': {'python': platform.python_version(), 'tk': tk.TkVersion, 'platform': platform.platform(),
+                 'lines': args.lines, 'repeat': args.repeat},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(output, file, indent=2)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}')
+    if failures:
+        print(f'{len(failures)} benchmark(s) failed: {", ".join(failures)}')
+    if regressions or failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Generates synthetic Python source, plain text and log files for the benchmarks.
+The same seed always gives the same file, so results are comparable between runs.
+"""
+
+import random
+
+
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do', 'eiusmod',
+         'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua', 'enim', 'ad', 'minim', 'veniam']
+LOG_LEVELS = ['DEBUG', 'INFO', 'INFO', 'INFO', 'WARNING', 'ERROR']
+
+
+def _identifier(rng):
+    return '_'.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+
+
+def python_source(lines, seed=0):
+    """
+    Returns roughly lines lines of Python made of classes, functions, strings, docstrings and comments
+    """
+    rng = random.Random(seed)
+    out = []
+    while len(out) < lines:
+        name = _identifier(rng)
+        out.append(f'class {name.title().replace("_", "")}(object):')
+        out.append('    """')
+        out.append(f'    {" ".join(rng.choice(WORDS) for _ in range(10))}')
+        out.append('    """')
+        for _ in range(rng.randint(1, 4)):
+            out.append(f'    def {_identifier(rng)}(self, {_identifier(rng)}, value=None):')
+            out.append(f"        '''{' '.join(rng.choice(WORDS) for _ in range(6))}'''")
+            out.append(f'        # {" ".join(rng.choice(WORDS) for _ in range(8))}')
+            out.append(f'        result = [str(item) for item in range({rng.randint(1, 100)}) if item is not None]')
+            out.append(f'        if isinstance(value, dict) and len(result) > {rng.randint(1, 10)}:')
+            out.append(f'            print("{rng.choice(WORDS)} \\"{rng.choice(WORDS)}\\"", self.{_identifier(rng)})')
+            out.append(f"            return f'{{value}} {rng.choice(WORDS)}'")
+            out.append('        return None')
+            out.append('')
+        out.append('')
+    return '\n'.join(out[:lines]) + '\n'
+
+
+def plain_text(lines, seed=0):
+    """
+    Returns lines lines of prose
+    """
+    rng = random.Random(seed)
+    return ''.join(' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 16))).capitalize() + '.\n'
+                   for _ in range(lines))
+
+
+def log_file(lines, seed=0):
+    """
+    Returns lines lines of timestamped log messages
+    """
+    rng = random.Random(seed)
+    out = []
+    for i in range(lines):
+        seconds = i * 7
+        out.append(f'2023-03-{1 + seconds // 86400 % 28:02} {seconds // 3600 % 24:02}:{seconds // 60 % 60:02}:'
+                   f'{seconds % 60:02},{rng.randint(0, 999):03} {rng.choice(LOG_LEVELS)} {_identifier(rng)}: '
+                   f'{" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 10)))} id={rng.randint(0, 99999)}\n')
+    return ''.join(out)
+
+
+GENERATORS = {'py': python_source, 'txt': plain_text, 'log': log_file}
+
+
+def write_file(path, kind, lines, seed=0):
+    with open(path, 'w') as file:
+        file.write(GENERATORS[kind](lines, seed))
+    return path
@@ -3,11 +3,16 @@ import tkinter.ttk as ttk
 
 
 import editor
+import profiling
 import utils
 
 
 class FindAndReplaceWin:
     """Dialog window for find and replace operations"""
+    # Replace All merges matches that are fewer than this many characters apart into one edit
+    replace_region_gap = 4096
+    # How long typing in the find entry has to pause before the search is run again
+    search_delay_ms = 150
 
     def __init__(self, parent, editor_obj: editor.Editor):
         self.parent = parent
@@ -20,8 +25,15 @@ class FindAndReplaceWin:
         self.match_case.set(0)
         self.match_word.set(0)
         self.is_find_all = None
-
-        self.find_entry = ttk.Entry(self.parent, width=25)
+        # Results are cached between searches and kept up to date by the editor's edits
+        self.search_cache = utils.SearchCache(self.editor_obj)
+        self.editor_obj.add_edit_listener(self.search_cache.apply_edit)
+        self.parent.bind('<Destroy>', self.on_destroy, add='+')
+        self._search_id = None
+        self.find_text = tk.StringVar()
+        self.find_text.trace_add('write', self.on_find_text_changed)
+
+        self.find_entry = ttk.Entry(self.parent, width=25, textvariable=self.find_text)
         self.find_button = ttk.Button(self.parent, text="Find", command=self.find)
         self.find_all_button = ttk.Button(self.parent, text="Find All", command=self.find_all)
         self.match_case_label = ttk.Label(self.parent, text="Match Case")
@@ -52,6 +64,31 @@ class FindAndReplaceWin:
 
         utils.clear_tags('found', self.editor_obj)
 
+    def on_destroy(self, event):
+        if event.widget is not self.parent:
+            return
+        self.editor_obj.remove_edit_listener(self.search_cache.apply_edit)
+        if self._search_id is not None:
+            self.parent.after_cancel(self._search_id)
+            self._search_id = None
+
+    def on_find_text_changed(self, *args):
+        # Searches as you type, once typing pauses
+        if self._search_id is not None:
+            self.parent.after_cancel(self._search_id)
+        self._search_id = self.parent.after(self.search_delay_ms, self.search_as_you_type)
+
+    def search_as_you_type(self):
+        self._search_id = None
+        if self.find_entry.get() == '':
+            utils.clear_tags('found', self.editor_obj)
+            self.found_word_indexes = []
+            self.word_count_label.configure(text="None")
+        elif self.is_find_all is None:
+            self.find()
+        else:
+            self.refresh_found_words()
+
     def refresh_found_words(self):
         if self.is_find_all is None:
             return
@@ -60,23 +97,25 @@ class FindAndReplaceWin:
         else:
             self.find()
 
+    def get_search_pattern(self):
+        '''
+        Compiles the contents of the find entry into a regex with the current Match Case/Match Word options
+        Returns None if the find entry is empty
+        '''
+        word = self.find_entry.get()
+        if word == '':
+            return None
+        return utils.compile_search(word, no_case=not self.match_case.get(), match_word=self.match_word.get())
+
     def get_word_index(self, start='1.0'):
         '''
         Finds a word within the editor and returns it's index
         Returns False if no word was found
         '''
-        word = self.find_entry.get()
-        if word == '':
+        pattern = self.get_search_pattern()
+        if pattern is None:
             return False
-        if self.match_word.get():
-            return utils.get_first_string_index(f"\\m{word}\\M", self.editor_obj,
-                                                regex=True,
-                                                no_case=not self.match_case.get(),
-                                                start=start)
-        else:
-            return utils.get_first_string_index(word, self.editor_obj,
-                                                no_case=not self.match_case.get(),
-                                                start=start)
+        return utils.find_first_span(pattern, self.editor_obj, start=start)
 
     def get_all_word_indexes(self, start='1.0'):
         '''
@@ -87,20 +126,14 @@ class FindAndReplaceWin:
         word = self.find_entry.get()
         if word == '':
             return False
-        if self.match_word.get():
-            self.found_word_indexes = utils.get_string_indexes(f"\\m{word}\\M", self.editor_obj,
-                                                               regex=True,
-                                                               no_case=not self.match_case.get(),
-                                                               start=start)
-        else:
-            self.found_word_indexes = utils.get_string_indexes(word, self.editor_obj,
-                                                               no_case=not self.match_case.get(),
-                                                               start=start)
+        self.found_word_indexes = self.search_cache.find(word, no_case=not self.match_case.get(),
+                                                         match_word=self.match_word.get(), start=start)
         if self.found_word_indexes:
             return True
         else:
             return False
 
+    @profiling.timed('find')
     def find(self):
         if self.is_find_all or self.is_find_all is None:
             self.is_find_all = False
@@ -119,6 +152,7 @@ class FindAndReplaceWin:
             self.word_count_label.configure(text=f"{self.word_counter}/{len(self.found_word_indexes)}")
             self.editor_obj.see(self.found_word_indexes[0][0])
 
+    @profiling.timed('find')
     def find_all(self):
         if not self.is_find_all or self.is_find_all is None:
             self.is_find_all = True
@@ -132,10 +166,10 @@ class FindAndReplaceWin:
         if not result:
             self.word_count_label.configure(text="None")
         else:
-            for word in self.found_word_indexes:
-                self.editor_obj.tag_add('found', word[0], word[1])
+            self.editor_obj.tag_add('found', *[index for word in self.found_word_indexes for index in word])
             self.word_count_label.configure(text=f"Total: {len(self.found_word_indexes)}")
 
+    @profiling.timed('find')
     def replace(self):
         if not self.found_word_indexes:
             return
@@ -151,19 +185,42 @@ class FindAndReplaceWin:
         self.word_counter -= 1
         self.next_instance()
 
+    @profiling.timed('find')
     def replace_all(self):
         if not self.found_word_indexes:
             return
+        pattern = self.get_search_pattern()
+        if pattern is None:
+            return
         replace_word = self.replace_entry.get()
         utils.clear_tags('found', self.editor_obj)
-        # Since that are constantly changing the text, we will ignore the
-        # indexes self.found_word_indexes and just find the words as we go
-        start = '1.0'
-        for i in range(len(self.found_word_indexes)):
-            word_start, word_end = self.get_word_index(start=start)
-            self.editor_obj.delete(word_start, word_end)
-            self.editor_obj.insert(word_start, replace_word)
-            start = word_end
+        # Work out the replaced text in one pass over a snapshot. Matches that are close together are grouped into a
+        # single changed region, so the editor only sees one delete and one insert per region
+        text = self.editor_obj.document.text()
+        regions = []
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            if start == end:
+                continue
+            if regions and start - regions[-1][1] < self.replace_region_gap:
+                region = regions[-1]
+                region[2].append(text[region[1]:start])
+                region[2].append(replace_word)
+                region[1] = end
+            else:
+                regions.append([start, end, [replace_word]])
+        # Everything is done as a single undo step. The regions are replaced back to front so the offsets of the ones
+        # before them stay valid
+        self.editor_obj.configure(autoseparators=False)
+        self.editor_obj.edit_separator()
+        try:
+            for start, end, replacement in reversed(regions):
+                start_index = self.editor_obj.document.offset_to_index(start)
+                self.editor_obj.delete(start_index, self.editor_obj.document.offset_to_index(end))
+                self.editor_obj.insert(start_index, ''.join(replacement))
+        finally:
+            self.editor_obj.edit_separator()
+            self.editor_obj.configure(autoseparators=True)
         self.found_word_indexes = []
         self.word_count_label.configure(text=f"None")
 
@@ -0,0 +1,313 @@
+import fnmatch
+import locale
+import multiprocessing
+import os
+import queue
+import threading
+import tkinter as tk
+import tkinter.ttk as ttk
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from tkinter import filedialog
+
+import utils
+
+
+# Directories that are never searched, on top of the ones listed in the searched directory's .gitignore
+IGNORED_DIRS = {'.git', '.hg', '.svn', '__pycache__', 'node_modules', '.venv', 'venv', '.mypy_cache', '.tox'}
+IGNORED_FILES = ['*.pyc', '*.pyo', '*.so', '*.o', '*.class', '*.journal']
+# Files bigger than this are skipped
+MAX_FILE_SIZE = 64 * 1024 * 1024
+# Number of bytes at the start of a file that are checked for NUL bytes to tell whether it's binary
+BINARY_CHECK_SIZE = 8192
+# Matching lines are cut down to this many characters in the results list
+MAX_LINE_LENGTH = 200
+
+
+def load_ignore_patterns(directory):
+    """
+    Reads the simple glob patterns of a .gitignore file in directory. Negated patterns aren't supported
+    """
+    patterns = list(IGNORED_FILES)
+    try:
+        with open(os.path.join(directory, '.gitignore'), encoding='utf-8', errors='replace') as file:
+            for line in file:
+                line = line.strip()
+                if line and not line.startswith(('#', '!')):
+                    patterns.append(line.strip('/'))
+    except OSError:
+        pass
+    return patterns
+
+
+def is_ignored(name, relative_path, patterns):
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern) for pattern in patterns)
+
+
+def walk_files(directory, patterns, stop_event=None):
+    """
+    Yields the paths of all files under directory that aren't ignored
+    """
+    directories = [directory]
+    while directories:
+        if stop_event is not None and stop_event.is_set():
+            return
+        current = directories.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            relative_path = os.path.relpath(entry.path, directory).replace(os.sep, '/')
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in IGNORED_DIRS and not is_ignored(entry.name, relative_path, patterns):
+                        directories.append(entry.path)
+                elif entry.is_file() and not is_ignored(entry.name, relative_path, patterns):
+                    if entry.stat().st_size <= MAX_FILE_SIZE:
+                        yield entry.path
+            except OSError:
+                continue
+
+
+def search_files(paths, string, no_case, match_word):
+    """
+    Searches a batch of files. Runs in the worker processes, so it only takes and returns plain values
+    Returns a list of (path, line number, line) for every line with a match
+    """
+    pattern = utils.compile_search(string, no_case=no_case, match_word=match_word)
+    encoding = locale.getpreferredencoding(False)
+    hits = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            continue
+        if b'\0' in data[:BINARY_CHECK_SIZE]:
+            continue
+        text = data.decode(encoding, errors='replace')
+        line_number = 1
+        position = 0
+        line_end = -1
+        for match in pattern.finditer(text):
+            if match.start() < line_end:
+                # Only the first match on each line is reported
+                continue
+            line_number += text.count('\n', position, match.start())
+            line_start = text.rfind('\n', 0, match.start()) + 1
+            line_end = text.find('\n', match.start())
+            if line_end == -1:
+                line_end = len(text)
+            position = line_start
+            hits.append((path, line_number, text[line_start:line_end].strip()[:MAX_LINE_LENGTH]))
+    return hits
+
+
+class FindInFilesWin:
+    """Dialog window for searching all the files in a directory"""
+    # Files are handed to the worker processes in batches of this many
+    batch_size = 32
+    # How often results from the workers are checked for, in milliseconds
+    poll_interval_ms = 50
+    # The search stops once this many matching lines were found
+    max_hits = 10000
+
+    def __init__(self, parent, file_menu):
+        self.parent = parent
+        self.parent.title("Find in Files")
+        self.file_menu = file_menu
+        self.match_word = tk.IntVar()
+        self.match_case = tk.IntVar()
+        self.match_case.set(0)
+        self.match_word.set(0)
+        self.directory = tk.StringVar()
+        self.directory.set(os.path.dirname(file_menu.filepath) if os.path.isabs(file_menu.filepath)
+                           else os.getcwd())
+        # (path, line number) of every line in the results list
+        self.hits = []
+        self._executor = None
+        self._walker = None
+        self._stop_event = None
+        # Futures of the running search's batches, so the ones that haven't started yet can be cancelled
+        self._futures = []
+        self._results = queue.Queue()
+        # Every search gets a new generation, so results from a search that was replaced can be told apart
+        self._generation = 0
+        self._batches = 0
+        self._batches_done = 0
+        self._walked = False
+        self._files = set()
+        self._poll_id = None
+
+        self.directory_entry = ttk.Entry(self.parent, width=40, textvariable=self.directory)
+        self.browse_button = ttk.Button(self.parent, text="Browse", command=self.browse)
+        self.find_entry = ttk.Entry(self.parent, width=40)
+        self.find_button = ttk.Button(self.parent, text="Find", command=self.search)
+        self.match_case_label = ttk.Label(self.parent, text="Match Case")
+        self.match_case_check = ttk.Checkbutton(self.parent, variable=self.match_case)
+        self.match_case_check.state(['!alternate'])
+        self.match_word_label = ttk.Label(self.parent, text="Match Word")
+        self.match_word_check = ttk.Checkbutton(self.parent, variable=self.match_word)
+        self.match_word_check.state(['!alternate'])
+        self.results_frame = tk.Frame(self.parent)
+        self.results_list = tk.Listbox(self.results_frame, width=100, height=20, activestyle='none')
+        self.results_scrollbar = ttk.Scrollbar(self.results_frame, command=self.results_list.yview)
+        self.results_list.configure(yscrollcommand=self.results_scrollbar.set)
+        self.results_label = tk.Label(self.parent, anchor='w')
+
+        self.directory_entry.grid(row=0, column=0, padx=10, pady=(10, 0), sticky='we')
+        self.browse_button.grid(row=0, column=1, pady=(10, 0))
+        self.find_entry.grid(row=1, column=0, padx=10, sticky='we')
+        self.find_button.grid(row=1, column=1)
+        self.match_case_label.grid(row=1, column=2)
+        self.match_case_check.grid(row=1, column=3)
+        self.match_word_label.grid(row=1, column=4)
+        self.match_word_check.grid(row=1, column=5, padx=(0, 10))
+        self.results_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.results_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.results_frame.grid(row=2, column=0, columnspan=6, padx=10, pady=10, sticky='nsew')
+        self.results_label.grid(row=3, column=0, columnspan=6, padx=10, pady=(0, 10), sticky='we')
+        self.parent.grid_rowconfigure(2, weight=1)
+        self.parent.grid_columnconfigure(0, weight=1)
+
+        self.find_entry.bind('<Return>', self.search)
+        self.results_list.bind('<<ListboxSelect>>', self.open_hit)
+        self.parent.bind('<Destroy>', self.on_destroy, add='+')
+        self.find_entry.focus_set()
+
+    def browse(self):
+        directory = filedialog.askdirectory(initialdir=self.directory.get() or Path.home(), parent=self.parent)
+        if directory:
+            self.directory.set(directory)
+
+    def search(self, *args):
+        self.stop()
+        string = self.find_entry.get()
+        directory = self.directory.get()
+        self.results_list.delete(0, tk.END)
+        self.hits = []
+        if string == '' or not os.path.isdir(directory):
+            self.results_label.configure(text="None")
+            return
+        if self._executor is None:
+            # Worker processes are spawned rather than forked, since forking a process that runs Tk and other
+            # threads isn't safe
+            self._executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+        self._generation += 1
+        self._batches = 0
+        self._batches_done = 0
+        self._walked = False
+        self._files = set()
+        self._stop_event = threading.Event()
+        self._futures = []
+        self._walker = threading.Thread(target=self._walk, daemon=True,
+                                        args=(self._executor, self._generation, self._stop_event, self._futures,
+                                              directory, string, not self.match_case.get(),
+                                              bool(self.match_word.get())))
+        self._walker.start()
+        self.results_label.configure(text="Searching...")
+        self._poll_id = self.parent.after(self.poll_interval_ms, self._poll_results)
+
+    def _walk(self, executor, generation, stop_event, futures, directory, string, no_case, match_word):
+        # Runs on a worker thread. Finding the files and searching them overlap, since batches are handed to the
+        # process pool as soon as they're full
+        batches = 0
+        batch = []
+        patterns = load_ignore_patterns(directory)
+        try:
+            for path in walk_files(directory, patterns, stop_event):
+                batch.append(path)
+                if len(batch) == self.batch_size:
+                    self._submit(executor, generation, stop_event, futures, batch, string, no_case, match_word)
+                    batches += 1
+                    batch = []
+            if batch and not stop_event.is_set():
+                self._submit(executor, generation, stop_event, futures, batch, string, no_case, match_word)
+                batches += 1
+        except RuntimeError:
+            # The pool was shut down while walking
+            pass
+        self._results.put((generation, 'walked', batches))
+
+    def _submit(self, executor, generation, stop_event, futures, batch, string, no_case, match_word):
+        future = executor.submit(search_files, batch, string, no_case, match_word)
+        future.add_done_callback(lambda f: self._results.put((generation, 'hits', f)))
+        futures.append(future)
+        if stop_event.is_set():
+            # The search was stopped while this batch was being submitted
+            future.cancel()
+
+    def _poll_results(self):
+        self._poll_id = None
+        lines = []
+        while True:
+            try:
+                generation, kind, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self._generation:
+                continue
+            if kind == 'walked':
+                self._walked = True
+                self._batches = value
+                continue
+            self._batches_done += 1
+            if value.cancelled() or value.exception() is not None:
+                continue
+            for path, line_number, line in value.result():
+                if len(self.hits) >= self.max_hits:
+                    break
+                self.hits.append((path, line_number))
+                self._files.add(path)
+                relative_path = os.path.relpath(path, self.directory.get())
+                lines.append(f"{relative_path}:{line_number}: {line}")
+        if lines:
+            # Inserting everything that arrived since the last poll in one go keeps the list responsive
+            self.results_list.insert(tk.END, *lines)
+        if len(self.hits) >= self.max_hits:
+            self.stop()
+            self.results_label.configure(text=f"Stopped after {len(self.hits)} matches in {len(self._files)} files")
+        elif self._walked and self._batches_done >= self._batches:
+            self._stop_event = None
+            self._futures = []
+            self.results_label.configure(text=f"{len(self.hits)} matches in {len(self._files)} files"
+                                         if self.hits else "None")
+        else:
+            self.results_label.configure(text=f"Searching... {len(self.hits)} matches in {len(self._files)} files")
+            self._poll_id = self.parent.after(self.poll_interval_ms, self._poll_results)
+
+    def stop(self):
+        """
+        Stops the running search, if any
+        """
+        if self._poll_id is not None:
+            self.parent.after_cancel(self._poll_id)
+            self._poll_id = None
+        if self._stop_event is not None:
+            self._stop_event.set()
+            self._stop_event = None
+        # Batches that haven't started yet would hold up the next search
+        for future in list(self._futures):
+            future.cancel()
+        self._futures = []
+        # Results that are still on their way are dropped by _poll_results()
+        self._generation += 1
+
+    def open_hit(self, event=None):
+        selection = self.results_list.curselection()
+        if not selection:
+            return
+        path, line_number = self.hits[selection[0]]
+        if os.path.abspath(path) == self.file_menu.filepath and not self.file_menu.is_loading():
+            self.file_menu.goto_line(line_number)
+        else:
+            self.file_menu.open_file(path, line=line_number)
+
+    def on_destroy(self, event):
+        if event.widget is not self.parent:
+            return
+        self.stop()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,3 +1,7 @@
+import hashlib
+import json
+import os
+import sys
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import font as tk_font
@@ -5,18 +9,110 @@ from tkinter import font as tk_font
 import editor
 
 
+# Font families are looked up once per process, and are also cached in this file for as long as the installed fonts
+# don't change (see font_fingerprint())
+FONT_CACHE_FILE = '.fontCache'
+FONT_DIRS = ['~/.fonts', '~/.local/share/fonts', '~/.cache/fontconfig', '/usr/share/fonts', '/usr/local/share/fonts',
+             '/etc/fonts', '/etc/fonts/conf.d', '/var/cache/fontconfig', '~/Library/Fonts', '/Library/Fonts',
+             '/System/Library/Fonts', os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts')]
+_font_families = None
+
+
+def font_fingerprint(root):
+    """
+    Returns a fingerprint of the installed fonts, made from the modification times of the font and fontconfig
+    directories. Installing or removing fonts (or rebuilding the fontconfig cache) changes it
+    """
+    parts = [sys.platform, root.tk.call('tk', 'windowingsystem'), str(root.tk.call('info', 'patchlevel'))]
+    for directory in FONT_DIRS:
+        try:
+            info = os.stat(os.path.expanduser(directory))
+        except OSError:
+            continue
+        parts.append(f'{directory}:{info.st_mtime_ns}:{info.st_size}')
+    return hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+
+def get_font_families(root):
+    """
+    Returns the sorted font families known to Tk
+    """
+    global _font_families
+    if _font_families is not None:
+        return _font_families
+    fingerprint = font_fingerprint(root)
+    try:
+        with open(FONT_CACHE_FILE, 'r') as file:
+            cache = json.load(file)
+        if cache.get('fingerprint') == fingerprint:
+            _font_families = cache['families']
+            return _font_families
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    _font_families = sorted(set(tk_font.families(root)))
+    try:
+        with open(FONT_CACHE_FILE, 'w') as file:
+            json.dump({'fingerprint': fingerprint, 'families': _font_families}, file)
+    except OSError:
+        pass
+    return _font_families
+
+
+class FontIndex:
+    """
+    Case insensitive substring search over a list of names. Every name is indexed by the three letter sequences
+    (trigrams) it contains, so only the names that share all of the query's trigrams need to be checked. Queries that
+    extend the previous one check the previous results instead, when there are fewer of them
+    """
+    def __init__(self, names):
+        self.names = names
+        self._lower_names = [name.lower() for name in names]
+        self._trigrams = {}
+        for i, name in enumerate(self._lower_names):
+            for j in range(len(name) - 2):
+                self._trigrams.setdefault(name[j:j + 3], set()).add(i)
+        self._last_query = ''
+        self._last_matches = list(range(len(names)))
+
+    def search(self, query):
+        """
+        Returns the names containing query, in their original order
+        """
+        query = query.lower()
+        candidates = range(len(self.names))
+        if query.startswith(self._last_query):
+            candidates = self._last_matches
+        if len(query) >= 3:
+            # Smallest set first, so the intersection only goes through as many names as the rarest trigram has
+            trigram_sets = sorted((self._trigrams.get(query[j:j + 3], set()) for j in range(len(query) - 2)), key=len)
+            trigram_matches = trigram_sets[0].intersection(*trigram_sets[1:])
+            if len(trigram_matches) < len(candidates):
+                candidates = sorted(trigram_matches)
+        matches = [i for i in candidates if query in self._lower_names[i]]
+        self._last_query = query
+        self._last_matches = matches
+        return [self.names[i] for i in matches]
+
+
 class FontChooser:
     """Dialog window for choosing a font"""
+    # The preview is only re-rendered once the selection has stayed on a font for this many milliseconds
+    preview_delay_ms = 120
+
     def __init__(self, parent, editor_obj: editor.Editor):
         self.parent = parent
         self.parent.title("Font")
         self.parent.geometry("500x400")
         self.parent.resizable(False, False)
         self.editor_obj = editor_obj
-        self.font_list = sorted(set(tk_font.families()))
+        self.font_list = get_font_families(self.parent)
+        self.font_index = FontIndex(self.font_list)
+        self._preview_id = None
+        self.filter_text = tk.StringVar()
+        self.filter_text.trace_add('write', self.filter_fonts)
+        self.filter_entry = ttk.Entry(self.parent, textvariable=self.filter_text)
         self.font_box = tk.Listbox(self.parent, takefocus=1, exportselection=0)
-        for font in self.font_list:
-            self.font_box.insert(tk.END, font)
+        self.font_box.insert(tk.END, *self.font_list)
 
         self.scrollbar = ttk.Scrollbar(self.font_box)
         self.scrollbar.configure(command=self.font_box.yview)
@@ -32,6 +128,7 @@ class FontChooser:
 
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.confirm.pack(side=tk.BOTTOM)
+        self.filter_entry.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
         self.font_box.pack(side=tk.TOP, expand=True, fill=tk.BOTH)
         self.preview_frame.pack(expand=True, fill=tk.BOTH, pady=10)
 
@@ -46,15 +143,41 @@ class FontChooser:
         self.preview.configure(font=(self.editor_obj.font, 12))
 
         self.parent.bind("<Return>", self.save_font_choice)
-        self.font_box.bind('<ButtonRelease-1>', self.change_preview_font)
-        self.font_box.bind('<KeyRelease-Up>', self.change_preview_font)
-        self.font_box.bind('<KeyRelease-Down>', self.change_preview_font)
+        self.font_box.bind('<<ListboxSelect>>', self.change_preview_font)
+        self.filter_entry.bind('<Down>', lambda event: self.font_box.focus_set())
+        self.parent.bind('<Destroy>', self.on_destroy, add='+')
+
+    def filter_fonts(self, *args):
+        fonts = self.font_index.search(self.filter_text.get())
+        self.font_box.delete(0, tk.END)
+        if not fonts:
+            return
+        self.font_box.insert(tk.END, *fonts)
+        self.font_box.select_set(0)
+        self.font_box.activate(0)
+        self.change_preview_font()
+
+    def change_preview_font(self, *args):
+        # Arrowing through the list would otherwise re-render the preview with every font on the way
+        if self._preview_id is not None:
+            self.parent.after_cancel(self._preview_id)
+        self._preview_id = self.parent.after(self.preview_delay_ms, self.render_preview)
+
+    def render_preview(self):
+        self._preview_id = None
+        selection = self.font_box.curselection()
+        if selection:
+            self.preview.configure(font=(self.font_box.get(selection[0]), 12))
 
-    def change_preview_font(self, event):
-        preview_font = self.font_box.get(tk.ACTIVE if event.type.name == 'KeyRelease' else tk.ANCHOR)
-        self.preview.configure(font=(preview_font, 12))
+    def on_destroy(self, event):
+        if event.widget is self.parent and self._preview_id is not None:
+            self.parent.after_cancel(self._preview_id)
+            self._preview_id = None
 
     def save_font_choice(self, *args):
-        self.editor_obj.font = self.font_box.get(self.font_box.curselection())
+        selection = self.font_box.curselection()
+        if not selection:
+            return
+        self.editor_obj.font = self.font_box.get(selection[0])
         self.editor_obj.update_font()
         self.parent.destroy()
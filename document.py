@@ -0,0 +1,310 @@
+"""
+DOCUMENT MODEL FOR TKEDIT
+A Python side mirror of the editor's text, kept up to date from its edits (see editor.Editor), so that saving,
+searching and highlighting don't have to copy the text out of Tk.
+
+The text is kept as a piece table: a sequence of pieces, each a slice of an immutable string (the text that was
+inserted), so inserting or deleting never copies the rest of the text. The pieces are held in a persistent balanced
+tree (a treap ordered by position) where every node also knows the length and number of newlines of its subtree, so
+finding an offset or a line takes O(log n) steps and an edit only creates O(log n) new nodes.
+
+Nodes are never changed once they've been created, so a Snapshot of the text is just a reference to the root of the
+tree. Snapshots are free to take, stay the same after later edits and are safe to read from worker threads.
+"""
+
+import random
+
+# Inserted text is split into pieces of at most this many characters, which bounds the scan for a line inside a piece
+MAX_PIECE_LENGTH = 4096
+
+
+class _Node:
+    __slots__ = ('buffer', 'start', 'length', 'newlines', 'priority', 'left', 'right', 'total_length',
+                 'total_newlines')
+
+    def __init__(self, buffer, start, length, newlines, priority, left=None, right=None):
+        self.buffer = buffer
+        self.start = start
+        self.length = length
+        self.newlines = newlines
+        self.priority = priority
+        self.left = left
+        self.right = right
+        self.total_length = length
+        self.total_newlines = newlines
+        if left is not None:
+            self.total_length += left.total_length
+            self.total_newlines += left.total_newlines
+        if right is not None:
+            self.total_length += right.total_length
+            self.total_newlines += right.total_newlines
+
+
+def _with_children(node, left, right):
+    return _Node(node.buffer, node.start, node.length, node.newlines, node.priority, left, right)
+
+
+def _piece(buffer, start, length, priority=None):
+    return _Node(buffer, start, length, buffer.count('\n', start, start + length),
+                 random.random() if priority is None else priority)
+
+
+def _merge(left, right):
+    """
+    Returns a tree with the text of left followed by the text of right
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        return _with_children(left, left.left, _merge(left.right, right))
+    return _with_children(right, _merge(left, right.left), right.right)
+
+
+def _split(node, offset):
+    """
+    Returns (left, right) trees with the first offset characters of node and the rest
+    """
+    if node is None:
+        return None, None
+    left_length = node.left.total_length if node.left is not None else 0
+    if offset <= left_length:
+        left, right = _split(node.left, offset)
+        return left, _with_children(node, right, node.right)
+    if offset >= left_length + node.length:
+        left, right = _split(node.right, offset - left_length - node.length)
+        return _with_children(node, node.left, left), right
+    # The split falls inside this node's piece
+    head = offset - left_length
+    # Both halves keep the node's priority, which is at least as high as the priorities below it and no higher than the
+    # ones above it, so the tree stays in heap order
+    first = _piece(node.buffer, node.start, head, node.priority)
+    second = _piece(node.buffer, node.start + head, node.length - head, node.priority)
+    return _with_children(first, node.left, None), _merge(second, node.right)
+
+
+def _extend(node, offset, text):
+    """
+    Returns a tree where text was added to the end of the piece that ends at offset, or None if no piece ends there or
+    it would grow past MAX_PIECE_LENGTH. Typing goes into one piece this way, instead of a new one for every character
+    """
+    if node is None:
+        return None
+    left_length = node.left.total_length if node.left is not None else 0
+    if offset <= left_length:
+        left = _extend(node.left, offset, text)
+        return _with_children(node, left, node.right) if left is not None else None
+    end = left_length + node.length
+    if offset > end:
+        right = _extend(node.right, offset - end, text)
+        return _with_children(node, node.left, right) if right is not None else None
+    if offset < end or node.length + len(text) > MAX_PIECE_LENGTH:
+        return None
+    # The piece is copied along with the new text, which is bounded by MAX_PIECE_LENGTH
+    buffer = node.buffer[node.start:node.start + node.length] + text
+    return _Node(buffer, 0, len(buffer), node.newlines + text.count('\n'), node.priority, node.left, node.right)
+
+
+def _build(text):
+    """
+    Returns a balanced tree of the pieces of text
+    """
+    if not text:
+        return None
+    starts = list(range(0, len(text), MAX_PIECE_LENGTH))
+    # Higher nodes must get higher priorities, so the random priorities are handed out from the top level down
+    depths = [0] * len(starts)
+
+    def set_depths(first, last, depth):
+        if first > last:
+            return
+        middle = (first + last) // 2
+        depths[middle] = depth
+        set_depths(first, middle - 1, depth + 1)
+        set_depths(middle + 1, last, depth + 1)
+    set_depths(0, len(starts) - 1, 0)
+    priorities = [0.0] * len(starts)
+    for i, priority in zip(sorted(range(len(starts)), key=depths.__getitem__),
+                           sorted((random.random() for _ in starts), reverse=True)):
+        priorities[i] = priority
+
+    def build(first, last):
+        if first > last:
+            return None
+        middle = (first + last) // 2
+        start = starts[middle]
+        node = _piece(text, start, min(MAX_PIECE_LENGTH, len(text) - start), priorities[middle])
+        return _with_children(node, build(first, middle - 1), build(middle + 1, last))
+    return build(0, len(starts) - 1)
+
+
+class Snapshot:
+    """
+    An immutable view of the text at one point in time. Lines are numbered from 1, like Tk's indexes
+    """
+    def __init__(self, root=None):
+        self._root = root
+        # The whole text, joined the first time text() is called
+        self._text = None
+
+    def length(self):
+        return self._root.total_length if self._root is not None else 0
+
+    def line_count(self):
+        return self._root.total_newlines + 1 if self._root is not None else 1
+
+    def line_start(self, line):
+        """
+        Returns the offset that a line starts at. Lines past the end start at the end of the text
+        """
+        count = line - 1
+        if count <= 0:
+            return 0
+        if count > self.line_count() - 1:
+            return self.length()
+        node = self._root
+        base = 0
+        while node is not None:
+            left = node.left
+            left_newlines = left.total_newlines if left is not None else 0
+            if count <= left_newlines:
+                node = left
+                continue
+            base += left.total_length if left is not None else 0
+            count -= left_newlines
+            if count <= node.newlines:
+                position = node.start - 1
+                for _ in range(count):
+                    position = node.buffer.find('\n', position + 1)
+                return base + position - node.start + 1
+            count -= node.newlines
+            base += node.length
+            node = node.right
+        return self.length()
+
+    def line_of(self, offset):
+        """
+        Returns the line that the character at offset is on
+        """
+        node = self._root
+        newlines = 0
+        while node is not None:
+            left = node.left
+            left_length = left.total_length if left is not None else 0
+            if offset < left_length:
+                node = left
+                continue
+            newlines += left.total_newlines if left is not None else 0
+            offset -= left_length
+            if offset < node.length:
+                return newlines + node.buffer.count('\n', node.start, node.start + offset) + 1
+            newlines += node.newlines
+            offset -= node.length
+            node = node.right
+        return newlines + 1
+
+    def index_to_offset(self, index):
+        """
+        Converts a "line.col" index to an offset. The index must already be resolved, i.e. from text_widget.index()
+        """
+        line, col = str(index).split('.')
+        return self.line_start(int(line)) + int(col)
+
+    def offset_to_index(self, offset):
+        line = self.line_of(offset)
+        return f"{line}.{offset - self.line_start(line)}"
+
+    def chunks(self, start=0, end=None):
+        """
+        Yields the text between the offsets start and end as a series of strings, without joining them
+        """
+        if end is None:
+            end = self.length()
+        # An explicit stack instead of recursion, walking the tree in order and skipping subtrees outside the range
+        stack = []
+        node = self._root
+        base = 0
+        while stack or node is not None:
+            while node is not None:
+                left_length = node.left.total_length if node.left is not None else 0
+                stack.append((node, base + left_length))
+                if start >= base + left_length:
+                    # Nothing on the left is in range
+                    break
+                node = node.left
+            node, node_start = stack.pop()
+            if node_start >= end:
+                return
+            node_end = node_start + node.length
+            if node_end > start:
+                first = max(start, node_start) - node_start
+                last = min(end, node_end) - node_start
+                yield node.buffer[node.start + first:node.start + last]
+            base = node_end
+            node = node.right
+
+    def get(self, start=0, end=None):
+        """
+        Returns the text between the offsets start and end
+        """
+        if start == 0 and (end is None or end >= self.length()):
+            return self.text()
+        return ''.join(self.chunks(start, end))
+
+    def get_lines(self, first, last):
+        """
+        Returns lines first to last, in the same way as text_widget.get(f"{first}.0", f"{last}.end")
+        """
+        end = self.line_start(last + 1) - 1 if last < self.line_count() else self.length()
+        return self.get(self.line_start(first), max(end, self.line_start(first)))
+
+    def text(self):
+        if self._text is None:
+            self._text = ''.join(self.chunks())
+        return self._text
+
+
+class PieceTable(Snapshot):
+    """
+    The text of a document, which can be edited. snapshot() returns an immutable copy of it
+    """
+    def __init__(self, text=''):
+        Snapshot.__init__(self, _build(text))
+        self._snapshot = None
+
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = Snapshot(self._root)
+        return self._snapshot
+
+    def text(self):
+        # Shared with the snapshot, so the text is only joined once per version
+        return self.snapshot().text()
+
+    def insert(self, offset, text):
+        if not text:
+            return
+        root = _extend(self._root, offset, text)
+        if root is None:
+            left, right = _split(self._root, offset)
+            root = _merge(_merge(left, _build(text)), right)
+        self._root = root
+        self._snapshot = None
+
+    def delete(self, start, end):
+        if end <= start:
+            return
+        left, right = _split(self._root, start)
+        right = _split(right, end - start)[1]
+        self._root = _merge(left, right)
+        self._snapshot = None
+
+    def apply_edit(self, operation, start_offset, end_offset, text):
+        """
+        Applies an edit reported by editor.Editor
+        """
+        if operation == 'insert':
+            self.insert(start_offset, text)
+        else:
+            self.delete(start_offset, end_offset)
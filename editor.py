@@ -2,21 +2,349 @@ import os
 import tkinter as tk
 from tkinter import messagebox
 
+import document
+
 
 class Editor(tk.Text):
+    # Most entries kept in self.history. Older ones are dropped, so a tab switch never replays more than this many
+    # edits, and an inactive tab never holds on to more than this many pieces of text
+    max_history = 5000
+
     def __init__(self, parent):
         tk.Text.__init__(self, wrap=tk.WORD, undo=True)
         self.parent = parent
         self.settings_file = '.config'
-        if not os.path.exists(self.settings_file):
-            with open(self.settings_file, 'w+') as file:
-                file.write('font-family:Arial\nfont-size:14')
-            self.font = 'Arial'
-            self.font_size = 14
-        else:
+        self.font = 'Arial'
+        self.font_size = 14
+        # A missing settings file is only written when the editor is closed (see update_config())
+        if os.path.exists(self.settings_file):
             self.load_settings()
         self.tag_configure('found', foreground='white', background='red')
 
+        # Python side copy of the text, so saving, searching and highlighting don't copy it out of Tk every time. It
+        # also turns offsets into indexes and back without asking Tk
+        self.document = document.PieceTable()
+        # Number of edits made so far. Lets snapshots of the text tell whether they're still current
+        self.change_count = 0
+        # Unsaved edits are recorded in this journal for crash recovery (see journal.py) and written out in batches
+        self.journal = None
+        self.journal_flush_ms = 1000
+        self._journal_flush_id = None
+        # Everything that went into the undo history since it was last reset, so it can be rebuilt after the text was
+        # taken out of the editor (see rebuild_history()). Holds the same text as Tk's undo stack, or the last
+        # max_history edits of it
+        self.history = []
+        self._recording_history = True
+        # Edits made while undo is turned off don't go into Tk's undo history, and can't be rebuilt either
+        self._undo_enabled = True
+        # Edits made by an undo or redo that is running, which are recorded along with it
+        self._history_group = None
+        # Route the widget's Tcl command through self._proxy so that every insert and delete, including the ones
+        # made by Tk's own key bindings, can be reported to the edit listeners
+        self._edit_listeners = []
+        self._cursor_listeners = []
+        self._orig_command = self._w + '_orig'
+        self.tk.call('rename', self._w, self._orig_command)
+        self.tk.createcommand(self._w, self._proxy)
+
+    def add_edit_listener(self, callback):
+        '''
+        Registers a callback that is called after every change to the text as
+        callback(operation, start, end, text, start_offset, end_offset)
+            operation is either 'insert' or 'delete'
+            start and end are "line.col" indexes of the changed range as they were BEFORE a delete and AFTER an insert
+            text is the inserted text ('' for deletes)
+            start_offset and end_offset are the character offsets of the changed range, in the same way as start and end
+        '''
+        self._edit_listeners.append(callback)
+
+    def remove_edit_listener(self, callback):
+        if callback in self._edit_listeners:
+            self._edit_listeners.remove(callback)
+
+    def add_cursor_listener(self, callback):
+        '''
+        Registers a callback that is called with no arguments whenever the insert mark is moved with mark_set().
+        Edits move it too, which is reported to the edit listeners instead
+        '''
+        self._cursor_listeners.append(callback)
+
+    def remove_cursor_listener(self, callback):
+        if callback in self._cursor_listeners:
+            self._cursor_listeners.remove(callback)
+
+    def start_journal(self, edit_journal):
+        self.stop_journal()
+        self.journal = edit_journal
+
+    def stop_journal(self, delete=False):
+        '''
+        Stops recording edits. With delete=True the journal file is removed, otherwise pending edits are written out
+        and this waits until they're on disk
+        '''
+        if self.journal is None:
+            return
+        if self._journal_flush_id is not None:
+            self.after_cancel(self._journal_flush_id)
+            self._journal_flush_id = None
+        if delete:
+            self.journal.delete()
+        else:
+            self._flush_journal()
+            self.journal.wait()
+            self._check_journal()
+        self.journal = None
+
+    def _flush_journal(self):
+        # Only hands the edits over to the journal's worker thread, so typing never waits on the disk
+        self._journal_flush_id = None
+        if self.journal is not None:
+            self._check_journal()
+            self.journal.flush()
+
+    def _check_journal(self):
+        '''
+        Tells the user about the first write to the journal that failed. Later failures aren't reported again
+        '''
+        if self.journal.error is not None and not self.journal.error_reported:
+            self.journal.error_reported = True
+            messagebox.showerror('Error', f'Could not write the edit journal {self.journal.path}, so unsaved changes '
+                                          f'may not be recoverable after a crash\n{self.journal.error}')
+
+    def replay_journal(self, operations):
+        '''
+        Applies operations read from a journal (see journal.read_journal()) to the text. They're added to the undo
+        history, so a replayed journal can be undone step by step
+        '''
+        edit_journal = self.journal
+        self.journal = None
+        for operation in operations:
+            if operation[0] == 'i':
+                self.insert(self.document.offset_to_index(operation[1]), operation[2])
+            else:
+                self.delete(self.document.offset_to_index(operation[1]),
+                            self.document.offset_to_index(operation[2]))
+            # Every operation can be undone on its own
+            self.edit_separator()
+        self.journal = edit_journal
+
+    def rebuild_history(self, history):
+        '''
+        Rebuilds the undo history from a history this editor recorded (see self.history) whose edits led to the
+        current text. The text is taken back to where the history starts and everything in it is done again, so Tk
+        ends up with the same undo and redo stacks. If that goes wrong, the text is put back without any undo history
+        This takes two Tk calls for every edit in the history, which max_history keeps from growing without bounds.
+        If older edits were dropped, only the ones that are left can be undone again
+        '''
+        current = self.document.snapshot()
+        modified = self.edit_modified()
+        edit_journal = self.journal
+        self.journal = None
+        self._recording_history = False
+        try:
+            self.configure(undo=False)
+            for operation in reversed(history):
+                self._revert_operation(operation)
+            self.configure(undo=True, autoseparators=True)
+            self.edit_reset()
+            for operation in history:
+                self._redo_operation(operation)
+            rebuilt = self.document.text() == current.text()
+        except tk.TclError:
+            rebuilt = False
+        if not rebuilt:
+            history = []
+            self.configure(undo=False)
+            self.delete('1.0', tk.END)
+            self.insert('1.0', current.text())
+            self.configure(undo=True)
+            self.edit_reset()
+        self._recording_history = True
+        self.history = list(history)
+        self.journal = edit_journal
+        self.edit_modified(modified)
+
+    def _revert_operation(self, operation):
+        if operation[0] == 'i':
+            self.delete(self.document.offset_to_index(operation[1]),
+                        self.document.offset_to_index(operation[1] + len(operation[2])))
+        elif operation[0] == 'd':
+            self.insert(self.document.offset_to_index(operation[1]), operation[2])
+        elif operation[0] in ('u', 'r'):
+            for edit in reversed(operation[1]):
+                self._revert_operation(edit)
+
+    def _redo_operation(self, operation):
+        kind = operation[0]
+        if kind == 'i':
+            self.insert(self.document.offset_to_index(operation[1]), operation[2])
+        elif kind == 'd':
+            self.delete(self.document.offset_to_index(operation[1]),
+                        self.document.offset_to_index(operation[1] + len(operation[2])))
+        elif kind == 's':
+            self.edit_separator()
+        elif kind in ('u', 'r'):
+            try:
+                if kind == 'u':
+                    self.edit_undo()
+                else:
+                    self.edit_redo()
+            except tk.TclError:
+                # What it undid or redid was dropped from the history, so its edits are made without going into the
+                # undo history instead
+                self.configure(undo=False)
+                for edit in operation[1]:
+                    self._redo_operation(edit)
+                self.configure(undo=True)
+        else:
+            self.tk.call(self._w, 'configure', operation[1], operation[2])
+
+    def _notify_edit(self, operation, start, end, text):
+        self.change_count += 1
+        # The document hasn't seen this edit yet, so it converts the indexes as they were before it
+        start_offset = self.document.index_to_offset(start)
+        if operation == 'insert':
+            end_offset = start_offset + len(text)
+        else:
+            end_offset = self.document.index_to_offset(end)
+        if self._recording_history and not self._undo_enabled:
+            # Tk's undo history doesn't match the text anymore until it's reset
+            self.history = []
+        elif self._recording_history:
+            # ('i', offset, inserted text) or ('d', offset, deleted text)
+            if operation == 'insert':
+                entry = ('i', start_offset, text)
+            else:
+                entry = ('d', start_offset, self.document.get(start_offset, end_offset))
+            if self._history_group is not None:
+                self._history_group.append(entry)
+            else:
+                self._add_history(entry)
+        if self.journal is not None:
+            if operation == 'insert':
+                self.journal.record_insert(start_offset, text)
+            else:
+                self.journal.record_delete(start_offset, end_offset)
+            if self._journal_flush_id is None:
+                self._journal_flush_id = self.after(self.journal_flush_ms, self._flush_journal)
+        self.document.apply_edit(operation, start_offset, end_offset, text)
+        for callback in self._edit_listeners:
+            callback(operation, start, end, text, start_offset, end_offset)
+
+    def _orig_call(self, *args):
+        return self.tk.call((self._orig_command,) + args)
+
+    def _resolve_index(self, index):
+        '''
+        Converts an index to "line.col" form. Since Tk never touches the final newline of the widget, the "end" index
+        is resolved to the position just before it
+        '''
+        index = str(self._orig_call('index', index))
+        if index == str(self._orig_call('index', tk.END)):
+            index = str(self._orig_call('index', 'end-1c'))
+        return index
+
+    @staticmethod
+    def _end_of_insert(start, text):
+        line, col = map(int, start.split('.'))
+        newlines = text.count('\n')
+        if newlines:
+            last_line_length = len(text) - text.rfind('\n') - 1
+            return f'{line + newlines}.{last_line_length}'
+        return f'{line}.{col + len(text)}'
+
+    def _proxy(self, command, *args):
+        if command in ('insert', 'delete', 'replace') and str(self._orig_call('cget', '-state')) == tk.DISABLED:
+            # Tk ignores changes to a disabled widget, so there's nothing to report
+            return self._orig_call(command, *args)
+        if command == 'insert' and len(args) > 1:
+            start = self._resolve_index(args[0])
+            result = self._orig_call(command, *args)
+            text = ''.join(str(chars) for chars in args[1::2])
+            self._notify_edit('insert', start, self._end_of_insert(start, text), text)
+            return result
+        if command == 'delete' and args:
+            if len(args) > 2:
+                # Multiple ranges are split up and deleted back to front so each one can be reported on its own
+                ranges = [(args[i], args[i + 1] if i + 1 < len(args) else f'{args[i]}+1c')
+                          for i in range(0, len(args), 2)]
+                # Not resolved past "end" yet, so each range still gets Tk's special case for "end" below
+                ranges = [(str(self._orig_call('index', a)), str(self._orig_call('index', b))) for a, b in ranges]
+                ranges.sort(key=lambda r: tuple(map(int, r[0].split('.'))), reverse=True)
+                for start, end in ranges:
+                    self._proxy('delete', start, end)
+                return ''
+            start = str(self._orig_call('index', args[0]))
+            end = str(self._orig_call('index', args[1] if len(args) > 1 else f'{start}+1c'))
+            if self._orig_call('compare', start, '>=', end):
+                return ''
+            if end == str(self._orig_call('index', tk.END)):
+                # Tk never deletes its final newline. A range from the start of a line to "end" deletes whole lines
+                # instead, so the newline before the range is deleted in its place
+                end = str(self._orig_call('index', 'end-1c'))
+                if start.endswith('.0') and start != '1.0':
+                    start = str(self._orig_call('index', f'{start}-1c'))
+                if self._orig_call('compare', start, '>=', end):
+                    return self._orig_call(command, *args)
+            result = self._orig_call(command, *args)
+            self._notify_edit('delete', start, end, '')
+            return result
+        if command == 'replace' and len(args) > 2:
+            start = self._resolve_index(args[0])
+            self._proxy('delete', start, args[1])
+            return self._proxy('insert', start, *args[2:])
+        if command == 'edit' and args and self._recording_history:
+            return self._record_edit_command(*args)
+        if command == 'configure':
+            # Whether edits go into the undo history and how they're grouped
+            for option, value in zip(args[::2], args[1::2]):
+                if option == '-undo':
+                    self._undo_enabled = self.tk.getboolean(value)
+                if option in ('-undo', '-autoseparators') and self._recording_history:
+                    self._add_history(('c', option, value))
+        if command == 'mark' and len(args) > 2 and args[0] == 'set' and args[1] == tk.INSERT:
+            result = self._orig_call(command, *args)
+            for callback in self._cursor_listeners:
+                callback()
+            return result
+        return self._orig_call(command, *args)
+
+    def _add_history(self, entry):
+        self.history.append(entry)
+        if len(self.history) <= self.max_history:
+            return
+        # The oldest half is dropped at once, so this only happens every max_history / 2 edits. It's cut after a
+        # separator if there is one, so undo doesn't stop halfway through a step. The settings made by the dropped
+        # entries are kept, so the rest is done again the same way
+        cut = len(self.history) - self.max_history // 2
+        for i in range(cut - 1, cut - self.max_history // 4, -1):
+            if self.history[i][0] == 's':
+                cut = i + 1
+                break
+        settings = {operation[1]: operation for operation in self.history[:cut] if operation[0] == 'c'}
+        self.history[:cut] = settings.values()
+
+    def _record_edit_command(self, *args):
+        '''
+        Keeps self.history in step with the "edit" widget commands that change the undo history
+        '''
+        if args[0] == 'separator':
+            self._add_history(('s',))
+        elif args[0] == 'reset':
+            self.history = [('c', '-undo', self._orig_call('cget', '-undo')),
+                            ('c', '-autoseparators', self._orig_call('cget', '-autoseparators'))]
+        elif args[0] in ('undo', 'redo'):
+            self._history_group = []
+            try:
+                result = self._orig_call('edit', *args)
+            finally:
+                group = self._history_group
+                self._history_group = None
+            # Recorded as the command itself, so doing it again restores the redo stack too
+            self._add_history((args[0][0], group))
+            return result
+        return self._orig_call('edit', *args)
+
     def update_font(self):
         self.configure(font=(self.font, self.font_size))
 
@@ -26,10 +354,9 @@ class Editor(tk.Text):
 
     def load_settings(self):
         try:
-            with open(self.settings_file, 'r+') as file:
+            with open(self.settings_file, 'r') as file:
                 settings = file.readlines()
                 if not settings:
-                    file.write('font-family:Arial\nfont-size:14')
                     self.font = 'Arial'
                     self.font_size = 14
                     self.configure(font=(self.font, self.font_size))
@@ -38,10 +365,12 @@ class Editor(tk.Text):
             messagebox.showerror('Error', 'Could not open settings file')
             self.font = 'Arial'
             self.font_size = 14
+            return
         except OSError:
             messagebox.showerror('Error', 'Could not open settings file')
             self.font = 'Arial'
             self.font_size = 14
+            return
         self.font = settings[0].split(':')[1].strip('\n')
         try:
             self.font_size = int(settings[1].split(':')[1])
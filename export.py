@@ -0,0 +1,160 @@
+"""
+HEADLESS EXPORT FOR TKEDIT
+Renders files as syntax highlighted HTML or ANSI coloured text without opening a window, e.g. to publish highlighted
+listings as CI artefacts:
+    tkEdit.py --export html|ansi [--output DIR] FILES...
+
+Only the tokenizer is used (see syntax_highlighting/tokenizer.py), so no display is needed. Files are rendered in
+parallel by a pool of worker processes, and every output is written to DIR at the file's path relative to the current
+directory, with .html or .ansi appended.
+"""
+
+import html
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+FORMATS = ('html', 'ansi')
+# Files are handed to the worker processes this many at a time
+BATCH_SIZE = 8
+# Extension -> (tag colours, lexer), or None for plain text. Built per process as extensions come up
+_languages = {}
+
+
+def get_language(path):
+    """
+    Returns the (tag colours, tokenizer.Lexer) pair used to highlight a file, or None if it isn't highlighted
+    Raises OSError or grammar.GrammarError if its grammar can't be loaded
+    """
+    extension = os.path.splitext(path)[1][1:].lower()
+    if extension not in _languages:
+        language = None
+        if extension == 'py':
+            from syntax_highlighting import python
+            language = python.TAGS, python.lexer()
+        elif extension:
+            from syntax_highlighting import grammar, tokenizer
+            grammar_path = grammar.grammar_extensions().get(extension)
+            if grammar_path is not None:
+                compiled = grammar.load_grammar(grammar_path)
+                language = compiled['tags'], tokenizer.Lexer(compiled['rules'], compiled['words'],
+                                                             compiled['multiline_tokens'], compiled['pattern'])
+        _languages[extension] = language
+    return _languages[extension]
+
+
+def render_html(text, spans, colors, title=''):
+    """
+    Returns text as a standalone HTML page, with every (offset, length, token_type) span coloured
+    """
+    out = ['<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n',
+           f'<title>{html.escape(title)}</title>\n</head>\n<body>\n<pre>']
+    position = 0
+    for offset, length, token_type in spans:
+        out.append(html.escape(text[position:offset]))
+        token = html.escape(text[offset:offset + length])
+        color = colors.get(token_type)
+        out.append(f'<span style="color: {html.escape(color)}">{token}</span>' if color else token)
+        position = offset + length
+    out.append(html.escape(text[position:]))
+    out.append('</pre>\n</body>\n</html>\n')
+    return ''.join(out)
+
+
+def ansi_color(color):
+    """
+    Returns the 24-bit ANSI escape sequence for a "#rgb" or "#rrggbb" colour, or None for any other colour
+    """
+    if not color or color[0] != '#' or len(color) not in (4, 7):
+        return None
+    digits = color[1:] if len(color) == 7 else ''.join(digit * 2 for digit in color[1:])
+    try:
+        red, green, blue = (int(digits[i:i + 2], 16) for i in (0, 2, 4))
+    except ValueError:
+        return None
+    return f'\x1b[38;2;{red};{green};{blue}m'
+
+
+def render_ansi(text, spans, colors):
+    """
+    Returns text with every (offset, length, token_type) span coloured with ANSI escape sequences
+    """
+    escapes = {token_type: ansi_color(color) for token_type, color in colors.items()}
+    out = []
+    position = 0
+    for offset, length, token_type in spans:
+        out.append(text[position:offset])
+        escape = escapes.get(token_type)
+        token = text[offset:offset + length]
+        out.append(f'{escape}{token}\x1b[0m' if escape else token)
+        position = offset + length
+    out.append(text[position:])
+    return ''.join(out)
+
+
+def output_path(path, output_format, output_dir):
+    relative = os.path.relpath(os.path.abspath(path))
+    if os.path.isabs(relative) or relative.split(os.sep)[0] == os.pardir:
+        # Files outside of the current directory go straight into output_dir
+        relative = os.path.basename(path)
+    return os.path.join(output_dir, f'{relative}.{output_format}')
+
+
+def export_file(path, output_format, output_dir):
+    """
+    Renders a file in output_format and writes it to output_dir (see output_path())
+    Returns the path that was written
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace', newline='') as file:
+        text = file.read()
+    language = get_language(path)
+    colors, spans = ({}, []) if language is None else (language[0], language[1].tokenize(text))
+    if output_format == 'html':
+        rendered = render_html(text, spans, colors, os.path.basename(path))
+    else:
+        rendered = render_ansi(text, spans, colors)
+    out_path = output_path(path, output_format, output_dir)
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    with open(out_path, 'w', encoding='utf-8', newline='') as file:
+        file.write(rendered)
+    return out_path
+
+
+def export_batch(paths, output_format, output_dir):
+    """
+    Exports a batch of files. Runs in the worker processes, so it only takes and returns plain values
+    Returns a list of (path, written path or None, error message or None)
+    """
+    out = []
+    for path in paths:
+        try:
+            out.append((path, export_file(path, output_format, output_dir), None))
+        except (OSError, ValueError) as e:
+            out.append((path, None, str(e)))
+    return out
+
+
+def export_files(paths, output_format, output_dir, workers=None):
+    """
+    Exports files in parallel, printing what was written to stdout and any errors to stderr
+    Returns the number of files that couldn't be exported
+    """
+    batches = [paths[i:i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+    if len(batches) <= 1:
+        results = [export_batch(batch, output_format, output_dir) for batch in batches]
+    else:
+        # Worker processes are spawned rather than forked, like Find in Files does
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results = executor.map(export_batch, batches, [output_format] * len(batches),
+                                   [output_dir] * len(batches))
+            results = list(results)
+    failures = 0
+    for batch in results:
+        for path, out_path, error in batch:
+            if error is None:
+                print(out_path)
+            else:
+                failures += 1
+                print(f'{path}: {error}', file=sys.stderr)
+    return failures
@@ -0,0 +1,202 @@
+"""
+EDIT JOURNAL FOR TKEDIT
+An append-only log of the inserts and deletes made to a file since it was last saved, kept next to the file.
+
+If tkEdit crashes, the journal can be replayed on top of the file the next time it is opened to recover the unsaved
+work. The header records the length and CRC-32 of the text the edits were made on top of, so a journal is only ever
+replayed onto the exact text it belongs to.
+
+Format (one record per line):
+    tkEdit-journal 1 <base length> <base crc32>
+    i <offset> <inserted text as a JSON string>
+    d <start offset> <end offset>
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+
+HEADER = 'tkEdit-journal 1'
+
+# Batches of records waiting to be appended to their journals, as (journal, records) pairs. They're written out and
+# synced to disk by a single worker thread, so a slow disk never holds up typing
+_writes = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def journal_path(filepath):
+    directory, filename = os.path.split(filepath)
+    return os.path.join(directory, f'.{filename}.journal')
+
+
+def set_aside(path):
+    '''
+    Renames a journal that can't be replayed onto its file anymore (e.g. because the file was changed by another
+    program), so its edits aren't lost when a new journal is started
+    Returns the new path of the journal
+    '''
+    directory, filename = os.path.split(path)
+    new_path = os.path.join(directory, f'{filename[:-len(".journal")]}.{time.strftime("%Y%m%d-%H%M%S")}.journal')
+    os.replace(path, new_path)
+    return new_path
+
+
+def _write_batches():
+    while True:
+        edit_journal, records = _writes.get()
+        try:
+            with open(edit_journal.path, 'a', encoding='utf-8') as file:
+                file.write(records)
+                file.flush()
+                os.fsync(file.fileno())
+        except OSError as e:
+            if edit_journal.error is None:
+                edit_journal.error = e
+        finally:
+            _writes.task_done()
+
+
+def text_checksum(text, crc=0):
+    return zlib.crc32(text.encode('utf-8', errors='surrogatepass'), crc)
+
+
+def read_journal(path):
+    '''
+    Reads a journal file
+    Returns:
+        (base_length, base_crc, operations) where operations is a list of ('i', offset, text) and ('d', start, end)
+        None if there is no journal or it can't be read
+    '''
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            header = file.readline().split()
+            if len(header) != 4 or ' '.join(header[:2]) != HEADER:
+                return None
+            operations = []
+            for line in file:
+                if not line.endswith('\n'):
+                    # The last record was only partly written when tkEdit went down
+                    break
+                kind, first, rest = line[:-1].split(' ', 2)
+                if kind == 'i':
+                    operations.append(('i', int(first), json.loads(rest)))
+                else:
+                    operations.append(('d', int(first), int(rest)))
+            return int(header[2]), int(header[3]), operations
+    except (OSError, ValueError, UnicodeDecodeError):
+        return None
+
+
+class EditJournal:
+    def __init__(self, path):
+        self.path = path
+        # Operations not written to disk yet. Consecutive typing and backspacing is merged into single records
+        self._pending = []
+        # The first error a write on the worker thread ran into, and whether it was reported to the user yet
+        self.error = None
+        self.error_reported = False
+
+    def reset(self, base_length, base_crc):
+        '''
+        Starts a new, empty journal on top of a text of base_length characters with a CRC-32 of base_crc
+        '''
+        self._pending = []
+        self.wait()
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write(f'{HEADER} {base_length} {base_crc}\n')
+
+    def record_insert(self, offset, text):
+        if self._pending:
+            last = self._pending[-1]
+            if last[0] == 'i' and last[1] + len(last[2]) == offset:
+                self._pending[-1] = ('i', last[1], last[2] + text)
+                return
+        self._pending.append(('i', offset, text))
+
+    def record_delete(self, start, end):
+        if self._pending:
+            last = self._pending[-1]
+            if last[0] == 'd' and end == last[1]:
+                # Backspacing
+                self._pending[-1] = ('d', start, last[2])
+                return
+            if last[0] == 'd' and start == last[1]:
+                # Deleting forwards
+                self._pending[-1] = ('d', start, last[2] + end - start)
+                return
+        self._pending.append(('d', start, end))
+
+    def has_pending(self):
+        return bool(self._pending)
+
+    def flush(self):
+        '''
+        Hands the pending operations over to the worker thread, which appends them to the journal file. Doesn't wait
+        for them to be written (see wait())
+        '''
+        global _writer
+        if not self._pending:
+            return
+        records = []
+        for operation in self._pending:
+            if operation[0] == 'i':
+                records.append(f'i {operation[1]} {json.dumps(operation[2])}\n')
+            else:
+                records.append(f'd {operation[1]} {operation[2]}\n')
+        self._pending = []
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_batches, daemon=True)
+                _writer.start()
+        _writes.put((self, ''.join(records)))
+
+    def wait(self):
+        '''
+        Blocks until everything handed to the worker thread has been written and synced to disk
+        '''
+        _writes.join()
+
+    def tell(self):
+        '''
+        Flushes the journal and returns its size, which marks the point reached in the edit history
+        '''
+        self.flush()
+        self.wait()
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def compact(self, mark, base_length, base_crc):
+        '''
+        Called after the text as of mark (see tell()) was saved. Rewrites the journal on top of the saved text,
+        keeping only the operations recorded after mark
+        '''
+        self.flush()
+        self.wait()
+        tail = ''
+        if mark:
+            try:
+                with open(self.path, 'rb') as file:
+                    file.seek(mark)
+                    tail = file.read().decode('utf-8')
+            except (OSError, UnicodeDecodeError):
+                pass
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(f'{HEADER} {base_length} {base_crc}\n')
+            file.write(tail)
+        os.replace(temp_path, self.path)
+
+    def delete(self):
+        self._pending = []
+        # Writes that are still on their way would create the file again
+        self.wait()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,132 @@
+"""
+LARGE FILE VIEWER FOR TKEDIT
+Read-only paging mode for files that are too big to load into the editor.
+
+The file is memory mapped and only a window of lines around the viewport is ever loaded into the editor widget,
+so memory use stays flat no matter how big the file is. The scrollbar is mapped to the whole file by byte offset.
+"""
+
+import locale
+import mmap
+import os
+import tkinter as tk
+
+
+class LargeFileViewer:
+    # Number of bytes of the file that are loaded into the editor at once
+    window_size = 1024 * 1024
+    # The sparse line index stores the number of lines in front of every block of this many bytes
+    index_block_size = 16 * 1024 * 1024
+
+    def __init__(self, editor_obj, filepath):
+        self.editor_obj = editor_obj
+        self.filepath = filepath
+        self._file = open(filepath, 'rb')
+        try:
+            self.size = os.fstat(self._file.fileno()).st_size
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._file.close()
+            raise
+        self._encoding = locale.getpreferredencoding(False)
+        # Line counts at the start of each index block, built on first use by line_number()
+        self._block_lines = [0]
+        self._reload_id = None
+        self.window_start = 0
+        self.window_end = 0
+        self.first_line = 1
+        self.editor_obj.configure(undo=False)
+        self.load_window(0)
+
+    def close(self):
+        if self._reload_id is not None:
+            self.editor_obj.after_cancel(self._reload_id)
+            self._reload_id = None
+        self._mmap.close()
+        self._file.close()
+        self.editor_obj.configure(state=tk.NORMAL, undo=True)
+        self.editor_obj.delete(0.0, tk.END)
+        self.editor_obj.edit_reset()
+
+    def _line_start(self, offset):
+        return self._mmap.rfind(b'\n', 0, offset) + 1
+
+    def _line_end(self, offset):
+        newline = self._mmap.find(b'\n', offset)
+        if newline == -1:
+            return self.size
+        return newline + 1
+
+    def line_number(self, offset):
+        '''
+        Returns the line number of the line containing the byte at offset
+        '''
+        block = offset // self.index_block_size
+        while len(self._block_lines) <= block:
+            start = (len(self._block_lines) - 1) * self.index_block_size
+            lines = self._mmap[start:start + self.index_block_size].count(b'\n')
+            self._block_lines.append(self._block_lines[-1] + lines)
+        start = block * self.index_block_size
+        return self._block_lines[block] + self._mmap[start:offset].count(b'\n') + 1
+
+    def _window_line_offset(self, line):
+        '''
+        Returns the byte offset of a line of the window that is loaded into the editor
+        '''
+        offset = self.window_start
+        for _ in range(line - 1):
+            newline = self._mmap.find(b'\n', offset, self.window_end)
+            if newline == -1:
+                break
+            offset = newline + 1
+        return offset
+
+    def load_window(self, offset):
+        '''
+        Loads the lines around the byte at offset into the editor and scrolls so that its line is at the top
+        '''
+        self._reload_id = None
+        offset = max(0, min(offset, self.size))
+        start = self._line_start(max(0, offset - self.window_size // 2))
+        end = self._line_end(min(self.size, start + self.window_size))
+        if end - start > 4 * self.window_size:
+            # Don't load a huge single line in full
+            end = start + self.window_size
+        text = self._mmap[start:end].decode(self._encoding, errors='replace')
+        if text.endswith('\n'):
+            text = text[:-1]
+        self.editor_obj.configure(state=tk.NORMAL)
+        self.editor_obj.delete(0.0, tk.END)
+        self.editor_obj.insert(0.0, text)
+        self.editor_obj.configure(state=tk.DISABLED)
+        self.window_start = start
+        self.window_end = end
+        self.first_line = self.line_number(start)
+        top_line = self._mmap[start:max(start, self._line_start(offset))].count(b'\n') + 1
+        self.editor_obj.yview(f'{top_line}.0')
+
+    def yview(self, *args):
+        '''
+        Scrollbar command. Moving the scrollbar loads the part of the file it points to
+        '''
+        if args and args[0] == tk.MOVETO:
+            self.load_window(int(float(args[1]) * self.size))
+        else:
+            self.editor_obj.yview(*args)
+
+    def on_scroll(self, first, last):
+        '''
+        Called with the editor's view fractions. Returns the matching fractions of the whole file for the scrollbar,
+        or None if the view got close to the edge of the window and the next window is being loaded
+        '''
+        first, last = float(first), float(last)
+        if (first < 0.1 and self.window_start > 0) or (last > 0.9 and self.window_end < self.size):
+            if self._reload_id is None:
+                top_line = int(self.editor_obj.index('@0,0').split('.')[0])
+                self._reload_id = self.editor_obj.after_idle(self.load_window, self._window_line_offset(top_line))
+            return None
+        if not self.size:
+            return first, last
+        window_bytes = self.window_end - self.window_start
+        return ((self.window_start + first * window_bytes) / self.size,
+                (self.window_start + last * window_bytes) / self.size)
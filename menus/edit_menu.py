@@ -1,7 +1,6 @@
 from datetime import datetime
 import tkinter as tk
 
-from dialogs.find_and_replace import FindAndReplaceWin
 from utils import clear_tags
 
 
@@ -18,6 +17,7 @@ class EditMenu(tk.Menu):
                          command=lambda: self.editor_obj.event_generate('<<Paste>>'))
         self.add_command(label='Add Timestamp', accelerator='F5', command=self.add_timestamp)
         self.add_command(label='Find and Replace', accelerator='Ctrl+F', command=self.find_and_replace)
+        self.add_command(label='Find in Files', accelerator='Ctrl+Shift+F', command=self.find_in_files)
 
     def add_timestamp(self, *args):
         self.editor_obj.insert(tk.INSERT, datetime.now().strftime('%I:%M %p %m/%d/%Y'))
@@ -31,9 +31,18 @@ class EditMenu(tk.Menu):
         self.parent.FIND_AND_REP_WIN.resizable(False, False)
         self.parent.FIND_AND_REP_WIN.protocol('WM_DELETE_WINDOW', self.__quit_find_and_replace)
         self.parent.FIND_AND_REP_WIN.bind('<Destroy>', self.__quit_find_and_replace)
+        # Dialogs are only imported once they're first opened, to keep startup fast
+        from dialogs.find_and_replace import FindAndReplaceWin
         _ = FindAndReplaceWin(self.parent.FIND_AND_REP_WIN, self.parent.editor)
 
     def __quit_find_and_replace(self, *args):
         clear_tags('found', self.editor_obj)
         if isinstance(self.parent.FIND_AND_REP_WIN, tk.Toplevel):
             self.parent.FIND_AND_REP_WIN.destroy()
+
+    def find_in_files(self, *args):
+        if isinstance(self.parent.FIND_IN_FILES_WIN, tk.Toplevel):
+            self.parent.FIND_IN_FILES_WIN.destroy()
+        self.parent.FIND_IN_FILES_WIN = tk.Toplevel()
+        from dialogs.find_in_files import FindInFilesWin
+        _ = FindInFilesWin(self.parent.FIND_IN_FILES_WIN, self.parent.file_menu)
@@ -1,64 +1,276 @@
+import codecs
+import io
+import locale
 import os
 from pathlib import Path
+import stat
+import tempfile
+import threading
+import time
 import tkinter as tk
 from tkinter import messagebox, filedialog
 
+import journal
+import profiling
+import tabs
+
 
 class FileMenu(tk.Menu):
+    # Files are read and inserted into the editor this many bytes at a time
+    load_chunk_size = 1024 * 1024
+
     def __init__(self, parent):
         tk.Menu.__init__(self, tearoff=0)
         self.recent_files_save_file = '.recentFiles'
-        if not os.path.exists(self.recent_files_save_file):
-            with open(self.recent_files_save_file, 'w+') as file:
-                file.write('')
         self.parent = parent
         self.editor_obj = self.parent.editor
         self.recent_files = self.get_recent_files()
         self.filepath = 'Untitled.txt'
         self.filename = 'Untitled.txt'
+        # State of the file currently being loaded by open_file(), if any
+        self._load_file = None
+        self._load_decoder = None
+        self._load_size = 0
+        self._load_newline = ''
+        self._load_length = 0
+        self._load_crc = 0
+        self._load_id = None
+        # Line to move the cursor to once loading is done
+        self._load_goto_line = None
+        # Or the (cursor index, scroll fraction) to go back to, for tabs that are being restored
+        self._load_view = None
+        # Whether unsaved changes left in the journal are replayed without asking, for tabs that are being restored
+        self._load_restore = False
+        # Undo history to rebuild and highlighting to put back once the file is loaded, for tabs that are being restored
+        self._load_history = None
+        self._load_highlighting = None
+        # (size, modification time) of the file when the journal's base text was read from it or saved to it
+        self._journal_stat = None
+        # State of the save running on a worker thread, if any
+        self._save_thread = None
+        self._save_path = None
+        self._save_error = None
+        self._save_change_count = 0
+        self._save_journal_mark = 0
+        self._save_length = 0
+        self._save_crc = 0
+        self._save_requested = False
+        # New files get the same permissions open() would have given them
+        umask = os.umask(0)
+        os.umask(umask)
+        self._new_file_mode = 0o666 & ~umask
         self.add_command(label='Open', accelerator='Ctrl+O', command=lambda: self.open_from_filemanager())
         self.recent_menu = tk.Menu(self.parent, tearoff=0)
+        # Whether the recent files still exist is only checked once startup is done (see validate_recent_files())
         for f in self.recent_files:
-            if os.path.exists(f):
-                self.recent_menu.add_command(
-                    label=f"{os.path.split(f)[-1].strip()}",
-                    command=lambda name=f.strip(): self.open_file(name))
+            self.recent_menu.add_command(
+                label=f"{os.path.split(f)[-1].strip()}",
+                command=lambda name=f.strip(): self.open_file(name))
         self.add_cascade(label='Recent Files', menu=self.recent_menu)
         self.add_command(label='Save', accelerator='Ctrl+S', command=self.save)
         self.add_command(label='Save as', command=self.save_as)
         self.add_command(label='New', accelerator='Ctrl+N', command=self.new_file)
+        self.add_command(label='Close Tab', accelerator='Ctrl+W', command=self.close_tab)
 
-    def _config_syntax_highlighter(self):
+    def _config_syntax_highlighter(self, state=None):
         extension = self.filename.split('.')
         if len(extension) > 1:
-            self.parent.set_syntax_highlighter(extension[-1])
+            self.parent.set_syntax_highlighter(extension[-1].lower(), state)
         else:
             self.parent.set_syntax_highlighter(None)
         self.parent.update_syntax_highlighting()
 
     def _save_file(self):
-        text = self.editor_obj.get(0.0, tk.END)
+        '''
+        Saves a snapshot of the text on a worker thread. Saves requested while one is running are coalesced into a
+        single save of the latest text once it's done
+        '''
+        if self._save_thread is not None:
+            self._save_requested = True
+            return
+        snapshot = self.editor_obj.document.snapshot()
         try:
-            with open(self.filepath, 'w+') as file:
-                file.write(text)
-        except PermissionError:
-            messagebox.showerror('Error', f'Could not save {self.filepath}')
+            mode = stat.S_IMODE(os.stat(self.filepath).st_mode)
+        except OSError:
+            mode = self._new_file_mode
+        self._save_path = self.filepath
+        self._save_error = None
+        self._save_change_count = self.editor_obj.change_count
+        if self.editor_obj.journal is not None:
+            try:
+                self._save_journal_mark = self.editor_obj.journal.tell()
+            except OSError:
+                self._save_journal_mark = 0
+        self._save_thread = threading.Thread(target=self._write_file, args=(self.filepath, snapshot, mode), daemon=True)
+        self._save_thread.start()
+        self.parent.status.set_message(f'Saving {os.path.split(self.filepath)[-1]}...')
+        self.after(50, self._poll_save)
+
+    def _write_file(self, filepath, snapshot, mode):
+        '''
+        Runs on a worker thread. The snapshot (see document.Snapshot) is written to a temporary file in the same
+        directory, which is then moved over the original in one step, so a failed save never leaves a truncated file
+        behind
+        '''
+        started = time.perf_counter()
+        directory, filename = os.path.split(filepath)
+        self._save_length = snapshot.length()
+        self._save_crc = 0
+        try:
+            fd, temp_path = tempfile.mkstemp(prefix=f'.{filename}.', suffix='.tmp', dir=directory or None)
+            try:
+                with os.fdopen(fd, 'w') as file:
+                    # Written piece by piece rather than joined into one string first
+                    for chunk in snapshot.chunks():
+                        self._save_crc = journal.text_checksum(chunk, self._save_crc)
+                        file.write(chunk)
+                    # Tk always keeps a newline at the end of the text, which has always been saved along with it
+                    file.write('\n')
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.chmod(temp_path, mode)
+                os.replace(temp_path, filepath)
+            except BaseException:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+                raise
+        except OSError as e:
+            self._save_error = e
             return
+        try:
+            # Make the rename itself durable. Not every platform can open a directory, which is fine
+            dir_fd = os.open(directory or '.', os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
         except OSError:
-            messagebox.showerror('Error', f'Could not save {self.filepath}')
+            pass
+        if profiling.profiler.enabled:
+            profiling.profiler.record('save', time.perf_counter() - started)
+
+    def _poll_save(self):
+        if self._save_thread is None:
             return
-        self.parent.title(os.path.split(self.filepath)[-1])
-        self.editor_obj.edit_modified(False)
+        if self._save_thread.is_alive():
+            self.after(50, self._poll_save)
+            return
+        self._finish_save()
+
+    def _finish_save(self):
+        self._save_thread = None
+        self.parent.status.set_message('')
+        if self._save_error is not None:
+            self._save_requested = False
+            messagebox.showerror('Error', f'Could not save {self._save_path}')
+            return
+        if self._save_path == self.filepath:
+            self._rebase_journal()
+        # Only clear the modified flag if nothing was typed while the file was being written
+        if self._save_path == self.filepath and self.editor_obj.change_count == self._save_change_count:
+            self.parent.title(os.path.split(self.filepath)[-1])
+            self.editor_obj.edit_modified(False)
+        if self._save_requested:
+            self._save_requested = False
+            self._save_file()
+
+    def _rebase_journal(self):
+        '''
+        After a save, only the edits made since the saved snapshot need to stay in the journal
+        '''
+        edit_journal = self.editor_obj.journal
+        path = journal.journal_path(self._save_path)
+        try:
+            if edit_journal is not None and edit_journal.path == path:
+                edit_journal.compact(self._save_journal_mark, self._save_length, self._save_crc)
+            else:
+                # Saved under a new name (or for the first time)
+                self.editor_obj.stop_journal(delete=True)
+                edit_journal = journal.EditJournal(path)
+                edit_journal.reset(self._save_length, self._save_crc)
+                self.editor_obj.start_journal(edit_journal)
+            self._journal_stat = self._file_stat(self._save_path)
+        except OSError:
+            self.editor_obj.stop_journal()
+
+    @staticmethod
+    def _file_stat(filepath):
+        try:
+            info = os.stat(filepath)
+        except OSError:
+            return None
+        return info.st_size, info.st_mtime_ns
+
+    def _start_journal(self, base_length, base_crc, restore=False):
+        '''
+        Starts journaling edits to the current file. If a journal of unsaved changes made on top of the same text is
+        left over from a previous session, the user is offered to recover them. With restore=True the changes belong
+        to a tab that is being restored (see restore_tab()) and are replayed without asking
+        Returns True if the journal that was left over was made on top of the same text
+        '''
+        path = journal.journal_path(self.filepath)
+        recorded = journal.read_journal(path)
+        edit_journal = journal.EditJournal(path)
+        if recorded is not None and recorded[2]:
+            if recorded[:2] == (base_length, base_crc):
+                answer = restore or messagebox.askyesno(
+                    'Recover?', f'{self.filename} has unsaved changes from a previous session. Would you like to '
+                                f'recover them?')
+                if answer:
+                    self.editor_obj.replay_journal(recorded[2])
+                    self.editor_obj.start_journal(edit_journal)
+                    self.parent.title(f'*{self.filename}')
+                    return True
+            else:
+                # The changes were made on top of a different text, so they can't be replayed. They're kept instead of
+                # being overwritten by the new journal
+                try:
+                    kept_path = journal.set_aside(path)
+                except OSError:
+                    return False
+                messagebox.showerror('Error', f'{self.filename} was changed on disk, so its unsaved changes could not '
+                                              f'be restored. They were kept in {kept_path}')
+        elif restore and recorded is None:
+            messagebox.showerror('Error', f'The unsaved changes to {self.filename} could not be restored')
+        matched = recorded is not None and recorded[:2] == (base_length, base_crc)
+        try:
+            edit_journal.reset(base_length, base_crc)
+        except OSError:
+            return matched
+        self.editor_obj.start_journal(edit_journal)
+        return matched
+
+    def wait_for_save(self):
+        '''
+        Blocks until any running save (and any save coalesced into it) has finished
+        '''
+        while self._save_thread is not None:
+            self._save_thread.join()
+            self._finish_save()
 
     def get_recent_files(self):
-        with open(self.recent_files_save_file, 'r') as f:
-            files = f.read()
-            recent_files = []
-        for file in files.split(','):
-            if not os.path.exists(file):
-                continue
-            recent_files.append(file)
-        return recent_files
+        try:
+            with open(self.recent_files_save_file, 'r') as f:
+                files = f.read()
+        except OSError:
+            return []
+        return [file for file in files.split(',') if file]
+
+    def validate_recent_files(self):
+        '''
+        Drops recent files that don't exist anymore from the Recent Files menu
+        '''
+        recent_files = [f for f in self.recent_files if os.path.exists(f)]
+        if recent_files == self.recent_files:
+            return
+        self.recent_files = recent_files
+        self.recent_menu.delete(0, tk.END)
+        for f in self.recent_files:
+            self.recent_menu.add_command(
+                label=f"{os.path.split(f)[-1].strip()}",
+                command=lambda name=f.strip(): self.open_file(name))
 
     def store_recent_files(self):
         with open(self.recent_files_save_file, 'w+') as file:
@@ -79,40 +291,75 @@ class FileMenu(tk.Menu):
                     command=lambda name=path.strip(): self.open_file(name))
 
     def save(self, *args):
+        if self.is_loading():
+            messagebox.showerror('Error', f'{self.filename} is still loading')
+            return
+        if self.parent.viewer is not None:
+            messagebox.showerror('Error', f'{self.filename} is open read-only')
+            return
         if os.path.exists(self.filepath):
             self._save_file()
         else:
             self.save_as()
 
     def save_as(self):
+        if self.is_loading():
+            messagebox.showerror('Error', f'{self.filename} is still loading')
+            return
+        if self.parent.viewer is not None:
+            messagebox.showerror('Error', f'{self.filename} is open read-only')
+            return
         chosen_filepath = filedialog.asksaveasfilename(filetypes=[('All', '*'), ('.txt', '*.txt')],
                                                        initialdir=Path.home())
-        if chosen_filepath == ():
+        # Cancelling the dialog gives an empty tuple on some platforms and an empty string on others
+        if not chosen_filepath:
             messagebox.showerror('Error', 'File not saved!')
             return
         else:
             self.filepath = chosen_filepath
-            self.filename = os.path.split(os.path.split(chosen_filepath)[-1])
+            self.filename = os.path.split(chosen_filepath)[-1]
         self.update_recent_files()
+        self.parent.update_tab_title()
         self._save_file()
         self._config_syntax_highlighter()
 
-    def open_file(self, filepath):
-        filename = os.path.split(self.filepath)[-1]
-        if self.editor_obj.edit_modified() == 1:
-            answer = messagebox.askyesno('Save?', f'Would you like to save {filename} first?')
-            if answer:
-                self.save()
+    def open_file(self, filepath, line=None):
+        '''
+        Opens a file in a new tab, or selects its tab if it's already open. If line is given, the cursor is moved to
+        the start of that line once it's loaded
+        '''
+        filepath = os.path.abspath(filepath)
+        tab = self.parent.find_tab(filepath)
+        if tab is None and self.parent.active_tab_is_blank():
+            self.load_file(filepath, line)
+            return
+        if tab is None:
+            self.parent.add_tab(tabs.Tab(filepath))
+        else:
+            self.parent.select_tab(tab)
+        if line is None:
+            return
+        if self.is_loading():
+            self._load_goto_line = line
+        elif self.filepath == filepath:
+            self.goto_line(line)
+
+    def load_file(self, filepath, line=None, view=None, restore=False, history=None, highlighting=None):
+        '''
+        Loads a file into the editor, in place of the current document. If line is given, the cursor is moved to the
+        start of that line once it's loaded, otherwise view can give a (cursor index, scroll fraction) to go back to.
+        restore is passed on to _start_journal(). history is an undo history (see Editor.history) to rebuild on top
+        of the loaded text and its journal, and highlighting a syntax highlighter state (see Tab.highlighting) to put
+        back, for tabs that are being restored
+        '''
+        self.cancel_loading()
         try:
             filepath = os.path.abspath(filepath)
-            with open(filepath, 'r') as file:
-                text = file.read()
+            file = open(filepath, 'rb')
+            size = os.fstat(file.fileno()).st_size
         except PermissionError:
             messagebox.showerror('Error', f'Could not open {filepath}')
             return
-        except UnicodeDecodeError:
-            messagebox.showerror('Error', f'Could not open {filepath}')
-            return
         except OSError:
             messagebox.showerror('Error', f'Could not open {filepath}')
             return
@@ -120,22 +367,273 @@ class FileMenu(tk.Menu):
         self.filename = os.path.split(filepath)[-1]
         self.filepath = filepath
         self.parent.title(self.filename)
+        self.parent.update_tab_title()
         self.update_recent_files()
-        if isinstance(self.parent.FIND_AND_REP_WIN, tk.Toplevel):
-            self.parent.FIND_AND_REP_WIN.destroy()
-        if isinstance(self.parent.FONT_CHOOSE_WIN, tk.Toplevel):
-            self.parent.FONT_CHOOSE_WIN.destroy()
+        self.parent.close_large_file()
+        # The previous file's changes were either saved or thrown away by now
+        self.editor_obj.stop_journal(delete=True)
+        if size >= self.parent.large_file_threshold:
+            file.close()
+            self._open_read_only(filepath)
+            return
         self.editor_obj.delete(0.0, tk.END)
-        self.editor_obj.insert(0.0, text.strip('\n'))
+        # The undo stack would hold a second copy of the whole file, so it's only turned back on once loading is done.
+        # The editor is also disabled until then, so nothing can be typed into the middle of the file's text
+        self.editor_obj.configure(undo=False, state=tk.DISABLED)
+        if highlighting is None:
+            self._config_syntax_highlighter()
+        else:
+            # It's put back once the whole text is there, instead of lexing the text as it comes in
+            self.parent.set_syntax_highlighter(None)
+
+        # The file is read in chunks and decoded incrementally, so multibyte characters and \r\n pairs that are
+        # split between two chunks are still decoded correctly
+        self._load_file = file
+        self._load_size = size
+        self._load_decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(locale.getpreferredencoding(False))(), translate=True)
+        self._load_newline = ''
+        self._load_length = 0
+        self._load_crc = 0
+        self._load_goto_line = line
+        self._load_view = view
+        self._load_restore = restore
+        self._load_history = history
+        self._load_highlighting = highlighting
+        self.parent.bind('<Escape>', self.cancel_loading)
+        self._load_next_chunk()
+
+    def _open_read_only(self, filepath):
+        '''
+        Opens a file that is too big for the editor in the parent's read-only large file viewer
+        '''
+        self.parent.set_syntax_highlighter(None)
+        try:
+            self.parent.open_large_file(filepath)
+        except (OSError, ValueError):
+            messagebox.showerror('Error', f'Could not open {filepath}')
+            return
         self.editor_obj.edit_modified(False)
-        self._config_syntax_highlighter()
+        self.parent.title(f'{self.filename} (read only)')
+        self.parent.update_tab_title()
+
+    def is_loading(self):
+        return self._load_file is not None
+
+    @profiling.timed('open')
+    def _load_next_chunk(self):
+        self._load_id = None
+        try:
+            data = self._load_file.read(self.load_chunk_size)
+            text = self._load_decoder.decode(data, final=not data)
+        except (UnicodeDecodeError, OSError):
+            filepath = self.filepath
+            self.cancel_loading()
+            messagebox.showerror('Error', f'Could not open {filepath}')
+            return
+        # Saving adds a newline after the text (see _write_file()), so the file's final newline is left out. It's
+        # held back until the next chunk shows whether it's really at the end
+        text = self._load_newline + text
+        self._load_newline = ''
+        if text.endswith('\n'):
+            text = text[:-1]
+            self._load_newline = '\n'
+        if text:
+            self.editor_obj.configure(state=tk.NORMAL)
+            self.editor_obj.insert(tk.END, text)
+            self.editor_obj.configure(state=tk.DISABLED)
+            self._load_length += len(text)
+            self._load_crc = journal.text_checksum(text, self._load_crc)
+        if not data:
+            self._finish_loading()
+            return
+        if self._load_size:
+            percent = min(100, self._load_file.tell() * 100 // self._load_size)
+            self.parent.status.set_message(f'Loading {self.filename}... {percent}% (Esc to cancel)')
+        self._load_id = self.after(1, self._load_next_chunk)
+
+    def _stop_loading(self):
+        if self._load_id is not None:
+            self.after_cancel(self._load_id)
+            self._load_id = None
+        self._load_file.close()
+        self._load_file = None
+        self._load_decoder = None
+        self.parent.unbind('<Escape>')
+        self.editor_obj.configure(undo=True, state=tk.NORMAL)
+        self.editor_obj.edit_reset()
+
+    def _finish_loading(self):
+        self._stop_loading()
+        self.parent.status.set_message('')
+        self.editor_obj.edit_modified(False)
+        self.parent.title(self.filename)
+        matched = self._start_journal(self._load_length, self._load_crc, self._load_restore)
+        self._journal_stat = self._file_stat(self.filepath)
+        if self._load_history is not None and matched:
+            self.editor_obj.rebuild_history(self._load_history)
+        if self._load_highlighting is not None:
+            # Unsaved changes that weren't replayed leave a different text than the one it was made for
+            self._config_syntax_highlighter(self._load_highlighting if matched or not self._load_restore else None)
+        if self._load_goto_line is not None:
+            self.goto_line(self._load_goto_line)
+        elif self._load_view is not None:
+            self.editor_obj.mark_set(tk.INSERT, self._load_view[0])
+            self.editor_obj.yview_moveto(self._load_view[1])
+        self._load_goto_line = None
+        self._load_view = None
+        self._load_restore = False
+        self._load_history = None
+        self._load_highlighting = None
+
+    def goto_line(self, line):
+        self.editor_obj.mark_set(tk.INSERT, f'{line}.0')
+        self.editor_obj.see(tk.INSERT)
+        self.editor_obj.focus_set()
+
+    def cancel_loading(self, *args):
+        '''
+        Stops loading the current file. The partially loaded text is thrown away so it can never be saved over the file
+        '''
+        if not self.is_loading():
+            return
+        self._stop_loading()
+        self._load_goto_line = None
+        self._load_view = None
+        self._load_restore = False
+        self._load_history = None
+        self._load_highlighting = None
+        self.editor_obj.delete(0.0, tk.END)
+        self.filepath = 'Untitled.txt'
+        self.filename = 'Untitled.txt'
+        self.parent.filename = self.filepath
+        self.parent.title(self.filepath)
+        self.parent.set_syntax_highlighter(None)
+        self.editor_obj.edit_modified(False)
+        self.parent.update_tab_title()
+        self.parent.status.set_message('Loading cancelled')
+
+    def wait_for_loading(self):
+        '''
+        Blocks until the file being loaded (if any) has been loaded completely
+        '''
+        while self.is_loading():
+            if self._load_id is not None:
+                self.after_cancel(self._load_id)
+                self._load_id = None
+            self._load_next_chunk()
+
+    def stash_tab(self, tab):
+        '''
+        Takes the current document out of the editor and leaves it in tab in its compact form (see tabs.Tab)
+        '''
+        self.wait_for_save()
+        tab.filepath = self.filepath
+        tab.snapshot = None
+        tab.history = None
+        tab.highlighting = None
+        tab.file_stat = self._journal_stat
+        tab.read_only = self.parent.viewer is not None
+        if self.is_loading():
+            # It's loaded from the start again when the tab is selected
+            self._stop_loading()
+            self._load_goto_line = None
+            self._load_view = None
+            self._load_restore = False
+            self._load_history = None
+            self._load_highlighting = None
+            self.parent.status.set_message('')
+            tab.modified = False
+        else:
+            tab.modified = bool(self.editor_obj.edit_modified())
+            if not tab.read_only:
+                tab.cursor = self.editor_obj.index(tk.INSERT)
+                tab.scroll = self.editor_obj.yview()[0]
+                if any(operation[0] != 'c' for operation in self.editor_obj.history):
+                    tab.history = self.editor_obj.history
+                    self.editor_obj.history = []
+                tab.highlighting = self.parent.syntax_highlighting_state()
+        if tab.modified and (self.editor_obj.journal is None
+                             or self._file_stat(self.filepath) != self._journal_stat):
+            # There's nowhere else to keep the changes, or the file was changed by something else since the journal's
+            # base text was read from it, so the journal couldn't be replayed onto it
+            tab.snapshot = self.editor_obj.document.snapshot()
+        # Unsaved changes are left in the journal until the tab is restored. Its header is also what tells whether the
+        # undo history still fits the file
+        self.editor_obj.stop_journal(delete=tab.snapshot is not None or not (tab.modified or tab.history))
+        self.parent.close_large_file()
+        self.parent.set_syntax_highlighter(None)
+        # Without undo, so the text isn't copied into the undo history just to be thrown away
+        self.editor_obj.configure(undo=False)
+        self.editor_obj.delete(0.0, tk.END)
+        self.editor_obj.configure(undo=True)
+        self.editor_obj.edit_reset()
+        self.editor_obj.edit_modified(False)
+
+    def restore_tab(self, tab):
+        '''
+        Puts the document of a tab that was left by stash_tab() back into the editor
+        '''
+        self.filepath = 'Untitled.txt'
+        self.filename = 'Untitled.txt'
+        if tab.snapshot is not None:
+            self.editor_obj.configure(undo=False)
+            self.editor_obj.insert(0.0, tab.snapshot.text())
+            self.editor_obj.configure(undo=True)
+            self.editor_obj.edit_reset()
+            if tab.history is not None:
+                self.editor_obj.rebuild_history(tab.history)
+            tab.snapshot = None
+            self.filepath = tab.filepath
+            self.filename = tab.filename
+            self.editor_obj.edit_modified(True)
+            self.editor_obj.mark_set(tk.INSERT, tab.cursor)
+            self.editor_obj.yview_moveto(tab.scroll)
+            self.parent.title(f'*{self.filename}')
+            self._config_syntax_highlighter(tab.highlighting)
+        elif os.path.isabs(tab.filepath):
+            # The highlighting only fits the file if nothing else changed it in the meantime
+            highlighting = tab.highlighting if self._file_stat(tab.filepath) == tab.file_stat else None
+            self.load_file(tab.filepath, view=(tab.cursor, tab.scroll), restore=tab.modified, history=tab.history,
+                           highlighting=highlighting)
+        else:
+            self.parent.title(self.filename)
+            self.parent.set_syntax_highlighter(None)
+        tab.history = None
+        tab.highlighting = None
+        self.parent.update_tab_title()
+
+    def discard_tab(self, tab):
+        '''
+        Throws away what stash_tab() left of a tab that is closed without being selected again
+        '''
+        if tab.history is not None and not tab.modified and tab.snapshot is None and os.path.isabs(tab.filepath):
+            # The journal was only kept for its header (see stash_tab())
+            journal.EditJournal(journal.journal_path(tab.filepath)).delete()
+        tab.history = None
+        tab.highlighting = None
+
+    def ask_to_save(self):
+        '''
+        Asks whether to save the current document if it has unsaved changes
+        Returns False if the user cancelled, or the document couldn't be saved
+        '''
+        self.wait_for_loading()
+        if not self.editor_obj.edit_modified():
+            return True
+        answer = messagebox.askyesnocancel(title='Save?', message=f'Do you want to save {self.filename}?')
+        if answer is None:
+            return False
+        if answer:
+            self.save()
+            self.wait_for_save()
+            return not self.editor_obj.edit_modified()
+        return True
+
+    def close_tab(self, *args):
+        self.parent.close_tab()
 
     def open_from_filemanager(self, *args):
-        filename = os.path.split(self.filepath)[-1]
-        if self.editor_obj.edit_modified() == 1:
-            answer = messagebox.askyesno('Save?', f'Would you like to save {filename} first?')
-            if answer:
-                self.save()
         chosen_filepath = filedialog.askopenfilename(filetypes=[('All', '*'), ('.txt', '*.txt')],
                                                      initialdir=Path.home())
 
@@ -149,18 +647,4 @@ class FileMenu(tk.Menu):
         self.open_file(os.path.abspath(chosen_filepath))
 
     def new_file(self, *args):
-        if self.editor_obj.edit_modified() == 1:
-            filename = os.path.split(self.filepath)[-1]
-            answer = messagebox.askyesno('Save?', f'Would you like to save {filename} first?')
-            if answer:
-                self.save()
-        self.editor_obj.delete(0.0, tk.END)
-        self.filepath = 'Untitled.txt'
-        self.parent.filename = self.filepath
-        self.parent.title(self.filepath)
-        self.parent.set_syntax_highlighter(None)
-        self.editor_obj.edit_modified(False)
-        if isinstance(self.parent.FIND_AND_REP_WIN, tk.Toplevel):
-            self.parent.FIND_AND_REP_WIN.destroy()
-        if isinstance(self.parent.FONT_CHOOSE_WIN, tk.Toplevel):
-            self.parent.FONT_CHOOSE_WIN.destroy()
+        self.parent.add_tab(tabs.Tab())
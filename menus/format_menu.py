@@ -1,7 +1,5 @@
 import tkinter as tk
 
-from dialogs.font_chooser import FontChooser
-
 
 class FormatMenu(tk.Menu):
     def __init__(self, parent):
@@ -23,6 +21,8 @@ class FormatMenu(tk.Menu):
             self.parent.FONT_CHOOSE_WIN.destroy()
         self.parent.FONT_CHOOSE_WIN = tk.Toplevel()
         self.parent.FONT_CHOOSE_WIN.resizable(False, False)
+        # Imported on first use to keep startup fast
+        from dialogs.font_chooser import FontChooser
         _ = FontChooser(self.parent.FONT_CHOOSE_WIN, self.editor_obj)
         self.parent.FONT_CHOOSE_WIN.focus_set()
 
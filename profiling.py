@@ -0,0 +1,204 @@
+"""
+PROFILING FOR TKEDIT
+Opt-in latency instrumentation, turned on with tkEdit.py --profile or by setting the TKEDIT_PROFILE environment
+variable.
+
+Each stage (key handling, highlighting, clearing tags, find and file I/O) keeps its most recent timings, from which
+rolling p50/p95/p99 latencies are shown in the status bar and written to a JSON file when the editor is closed.
+When a capture threshold is given (tkEdit.py --profile-capture MS or TKEDIT_PROFILE_CAPTURE_MS), the first event to
+take at least that long is run under cProfile and its stats are dumped to a file that can be read with pstats.
+
+tkEdit.py --startup-timing prints how long each phase of startup took (see StartupTiming).
+"""
+
+import collections
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+
+class Profiler:
+    # Percentiles are computed from this many of the most recent timings of each stage
+    window = 1000
+
+    def __init__(self):
+        self.enabled = False
+        # Events that take at least this many milliseconds are captured with cProfile, None to turn capturing off
+        self.capture_ms = None
+        self.capture_path = 'tkedit-capture.prof'
+        self._timings = {}
+        # record() is called from worker threads (e.g. saving) while the Tk thread reads the timings
+        self._lock = threading.Lock()
+        self._depth = 0
+
+    def enable(self, capture_ms=None):
+        self.enabled = True
+        self.capture_ms = capture_ms
+
+    def record(self, stage, seconds):
+        """
+        Adds a timing to a stage. Safe to call from worker threads
+        """
+        with self._lock:
+            self._timings.setdefault(stage, collections.deque(maxlen=self.window)).append(seconds)
+
+    def _copy_timings(self, stage):
+        with self._lock:
+            return list(self._timings.get(stage, ()))
+
+    def _stages(self):
+        with self._lock:
+            return sorted(self._timings)
+
+    def measure(self, stage):
+        """
+        Returns a context manager that times its block as an event of stage
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return _Measurement(self, stage)
+
+    def percentiles(self, stage):
+        """
+        Returns the p50, p95 and p99 latencies of a stage in milliseconds
+        """
+        timings = sorted(self._copy_timings(stage))
+        if not timings:
+            return None
+        return tuple(timings[min(len(timings) - 1, int(len(timings) * p))] * 1000 for p in (0.5, 0.95, 0.99))
+
+    def status_text(self):
+        parts = []
+        for stage in self._stages():
+            p50, p95, p99 = self.percentiles(stage)
+            parts.append(f"{stage} {p50:.1f}/{p95:.1f}/{p99:.1f}")
+        if not parts:
+            return ""
+        return "p50/p95/p99 ms: " + "  ".join(parts)
+
+    def summary(self):
+        out = {}
+        for stage in self._stages():
+            timings = self._copy_timings(stage)
+            p50, p95, p99 = self.percentiles(stage)
+            out[stage] = {'count': len(timings), 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+                          'max_ms': max(timings) * 1000, 'mean_ms': sum(timings) / len(timings) * 1000}
+        return out
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def watch_keys(self, widget):
+        """
+        Times every key press on widget until the change it caused has been drawn
+        """
+        def on_key(event):
+            start = time.perf_counter()
+            # Tk redraws text widgets in an idle callback scheduled while the key is handled. An idle callback added
+            # from inside another one only runs on the next idle pass, which is after that redraw
+            widget.after_idle(lambda: widget.after_idle(lambda: self.record('key', time.perf_counter() - start)))
+        widget.bind('<KeyPress>', on_key, add='+')
+
+
+class _Measurement:
+    def __init__(self, profiler, stage):
+        self.profiler = profiler
+        self.stage = stage
+        self.start = 0
+        self.capture = None
+
+    def __enter__(self):
+        profiler = self.profiler
+        # Only outermost events on the main thread are captured, since cProfile can't be nested
+        if (profiler.capture_ms is not None and profiler._depth == 0
+                and threading.current_thread() is threading.main_thread()):
+            self.capture = cProfile.Profile()
+            try:
+                self.capture.enable()
+            except ValueError:
+                self.capture = None
+        profiler._depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        elapsed = time.perf_counter() - self.start
+        profiler = self.profiler
+        profiler._depth -= 1
+        if self.capture is not None:
+            self.capture.disable()
+            if profiler.capture_ms is not None and elapsed * 1000 >= profiler.capture_ms:
+                self.capture.dump_stats(profiler.capture_path)
+                profiler.capture_ms = None
+        profiler.record(self.stage, elapsed)
+        return False
+
+
+class StartupTiming:
+    """Records how far into startup each phase finished and prints a report once startup is done"""
+    def __init__(self):
+        self.enabled = False
+        self.started = 0
+        self.phases = []
+
+    def enable(self, started):
+        self.enabled = True
+        self.started = started
+        self.phases = []
+
+    def mark(self, phase):
+        if self.enabled:
+            self.phases.append((phase, time.perf_counter()))
+
+    def report(self, file=None):
+        if not self.enabled:
+            return
+        previous = self.started
+        lines = ['Startup timing:']
+        for phase, at in self.phases:
+            lines.append(f'  {phase:24} {(at - previous) * 1000:8.1f} ms   (at {(at - self.started) * 1000:8.1f} ms)')
+            previous = at
+        print('\n'.join(lines), file=file or sys.stderr)
+        self.enabled = False
+
+
+def timed(stage):
+    """
+    Decorator that times every call of a function as an event of stage
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with profiler.measure(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _capture_ms_from_environment():
+    """
+    Returns the capture threshold set with TKEDIT_PROFILE_CAPTURE_MS, or None. A bad value is warned about and
+    ignored, so it can't stop the editor from starting
+    """
+    value = os.environ.get('TKEDIT_PROFILE_CAPTURE_MS')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        print(f'Ignoring TKEDIT_PROFILE_CAPTURE_MS={value!r}, which is not a number of milliseconds', file=sys.stderr)
+        return None
+
+
+profiler = Profiler()
+startup = StartupTiming()
+if os.environ.get('TKEDIT_PROFILE'):
+    profiler.enable(_capture_ms_from_environment())
@@ -7,10 +7,47 @@ class StatusBar(ttk.Label):
         self.parent = parent
         self.line = 1
         self.column = 1
+        self.message = ""
+        # Latencies shown when profiling is turned on (see profiling.py)
+        self.profile = ""
+        # Number of selected characters, 0 if nothing is selected
+        self.selected = 0
+        # (lines, words, characters) of the whole text, None to hide them
+        self.totals = None
         self.status_text = f"Ln {self.line}, Col {self.column}"
         self.configure(text=self.status_text, anchor='e')
 
+    def _update_text(self):
+        parts = [text for text in (self.profile, self.message) if text]
+        position = f"Ln {self.line}, Col {self.column}"
+        if self.selected:
+            position += f" ({self.selected} selected)"
+        parts.append(position)
+        if self.totals is not None:
+            lines, words, chars = self.totals
+            parts.append(f"{lines} lines, {words} words, {chars} characters")
+        status_text = "    ".join(parts)
+        # Reconfiguring the label makes Tk redraw it, so that's skipped when nothing changed
+        if status_text != self.status_text:
+            self.status_text = status_text
+            self.configure(text=self.status_text)
+
     def update_line_and_col(self, line, col):
         self.line = line
         self.column = col
-        self.configure(text=f"Ln {self.line}, Col {self.column}")
+        self._update_text()
+
+    def update_status(self, line, col, selected=0, totals=None):
+        self.line = line
+        self.column = col
+        self.selected = selected
+        self.totals = totals
+        self._update_text()
+
+    def set_message(self, message):
+        self.message = message
+        self._update_text()
+
+    def set_profile(self, profile):
+        self.profile = profile
+        self._update_text()
@@ -0,0 +1,166 @@
+"""
+Grammar based syntax highlighting for tkEdit
+
+Languages can be added without writing a SyntaxHighlighter subclass by adding a JSON grammar file to
+syntax_highlighting/grammars. A grammar looks like this:
+
+{
+    "name": "JavaScript",
+    "extensions": ["js", "mjs"],
+    "tags": {"keywords": "#cc7a00", "strings": "#009900"},
+    "rules": [["strings", "\"[^\"\\n]*\""]],
+    "words": {"keywords": ["if", "else"]},
+    "multiline_tokens": [["strings", "`", "`", true]]
+}
+
+Rules are regexes that are tried in order, and words are matched as whole words after all of the rules (see
+SyntaxHighlighter.add_rule() and SyntaxHighlighter.add_words()). Every tag used by a rule or a word list needs a colour
+in "tags". "multiline_tokens" is optional and lists tokens that can span lines as [tag, opener regex, closer, escapes]
+(see SyntaxHighlighter.multiline_tokens).
+
+A grammar is only read and compiled the first time a file with one of its extensions is opened. The compiled form is
+cached in .grammarCache, keyed by a hash of the grammar file, so it's only compiled again after the grammar changes.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+import editor
+from syntax_highlighting import tokenizer
+from syntax_highlighting.syntax_highlighter import SyntaxHighlighter
+
+
+GRAMMAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grammars')
+CACHE_DIR = '.grammarCache'
+# Version of the compiled form. Bumping it makes every cached grammar get compiled again
+CACHE_VERSION = 2
+# Extension -> grammar file, built the first time a grammar is looked up
+_extensions = None
+# Hash of a grammar file -> its compiled form
+_compiled = {}
+
+
+class GrammarError(ValueError):
+    pass
+
+
+def grammar_extensions():
+    """
+    Returns a dict of the file extensions that have a grammar, mapped to the path of the grammar
+    """
+    global _extensions
+    if _extensions is None:
+        _extensions = {}
+        try:
+            names = sorted(os.listdir(GRAMMAR_DIR))
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(GRAMMAR_DIR, name)
+            try:
+                with open(path, encoding='utf-8') as file:
+                    extensions = json.load(file).get('extensions', [])
+            except (OSError, ValueError, AttributeError):
+                continue
+            for extension in extensions:
+                _extensions.setdefault(extension.lower(), path)
+    return _extensions
+
+
+def compile_grammar(grammar):
+    """
+    Checks a grammar and compiles it into the form GrammarSyntaxHighlighter is built from
+    Raises GrammarError if the grammar is invalid
+    """
+    try:
+        name = grammar.get('name', 'grammar')
+        tags = dict(grammar.get('tags', {}))
+        rules = [(str(tag_name), str(pattern)) for tag_name, pattern in grammar.get('rules', [])]
+        words = {}
+        for tag_name, tag_words in grammar.get('words', {}).items():
+            for word in tag_words:
+                words[str(word)] = tag_name
+        multiline_tokens = [(str(tag_name), str(opener), str(closer), bool(escapes))
+                            for tag_name, opener, closer, escapes in grammar.get('multiline_tokens', [])]
+    except (AttributeError, TypeError, ValueError) as e:
+        raise GrammarError(f'Malformed grammar: {e}')
+    for tag_name, pattern, closer, _ in multiline_tokens:
+        if not closer:
+            raise GrammarError(f'{name}: multiline token for "{tag_name}" has an empty closer')
+    for tag_name, pattern in rules + [token[:2] for token in multiline_tokens]:
+        try:
+            if re.compile(pattern).groupindex:
+                raise GrammarError(f'{name}: rule for "{tag_name}" must not use named groups')
+        except re.error as e:
+            raise GrammarError(f'{name}: invalid regex for "{tag_name}": {e}')
+    for tag_name in [rule[0] for rule in rules + multiline_tokens] + list(words.values()):
+        if tag_name not in tags:
+            raise GrammarError(f'{name}: tag "{tag_name}" has no colour')
+    return {'version': CACHE_VERSION, 'name': name, 'tags': tags, 'rules': rules, 'words': words,
+            'pattern': tokenizer.token_pattern(rules, bool(words), multiline_tokens),
+            'multiline_tokens': multiline_tokens}
+
+
+def load_grammar(path):
+    """
+    Returns the compiled form of a grammar file, from the cache if it hasn't changed since it was last compiled
+    Raises OSError if the file can't be read and GrammarError if it isn't a valid grammar
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if digest in _compiled:
+        return _compiled[digest]
+    cache_path = os.path.join(CACHE_DIR, f'{digest}.json')
+    compiled = None
+    try:
+        with open(cache_path, encoding='utf-8') as file:
+            compiled = json.load(file)
+        if compiled.get('version') != CACHE_VERSION:
+            compiled = None
+    except (OSError, ValueError, AttributeError):
+        compiled = None
+    if compiled is None:
+        try:
+            grammar = json.loads(data.decode('utf-8'))
+        except ValueError as e:
+            raise GrammarError(f'{os.path.basename(path)} is not valid JSON: {e}')
+        compiled = compile_grammar(grammar)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as file:
+                json.dump(compiled, file)
+        except OSError:
+            pass
+    _compiled[digest] = compiled
+    return compiled
+
+
+class GrammarSyntaxHighlighter(SyntaxHighlighter):
+    def __init__(self, text_obj: editor.Editor, grammar):
+        SyntaxHighlighter.__init__(self, text_obj)
+        self.name = grammar['name']
+        self.multiline_tokens = tuple(tuple(token) for token in grammar['multiline_tokens'])
+        for tag_name, color in grammar['tags'].items():
+            self.add_tag(tag_name, color)
+        self._rules = [tuple(rule) for rule in grammar['rules']]
+        self._words = dict(grammar['words'])
+        # Built from the precompiled pattern up front instead of on the first highlight pass
+        self._lexer = tokenizer.Lexer(self._rules, self._words, self.multiline_tokens, grammar['pattern'])
+
+    def highlight_syntax(self):
+        self.highlight_tokens()
+
+
+def highlighter_for_extension(text_obj, extension):
+    """
+    Returns a GrammarSyntaxHighlighter for files with the given extension, or None if there's no grammar for it
+    """
+    path = grammar_extensions().get(extension.lower())
+    if path is None:
+        return None
+    return GrammarSyntaxHighlighter(text_obj, load_grammar(path))
@@ -1,43 +1,53 @@
 from syntax_highlighting.syntax_highlighter import SyntaxHighlighter
+from syntax_highlighting import tokenizer
+import builtins
 import editor
-import re
-import utils
+
+
+STRING_PREFIX = r"(?:(?<!\w)(?i:rb|br|fr|rf|r|u|f|b))?"
+KEYWORDS = ['and', 'as', 'assert', 'break', 'class', 'continue', 'def', 'del', 'elif', 'else', 'except', 'False',
+            'finally', 'for', 'from', 'global', 'if', 'import', 'in', 'is', 'lambda', 'None', 'nonlocal', 'not', 'or',
+            'pass', 'raise', 'return', 'True', 'try', 'while', 'with', 'yield']
+BUILTINS = [name for name in dir(builtins) if name not in KEYWORDS]
+STRING_REGEX = STRING_PREFIX + r"(?:'[^'\\\n]*(?:\\.[^'\\\n]*)*'|\"[^\"\\\n]*(?:\\.[^\"\\\n]*)*\")"
+ONE_LINE_COMMENT_REGEX = r"#[^\n]*"
+FUNC_NAME_REGEX = r"(?<=\bdef )\w+"
+
+TAGS = {"keywords": "#cc7a00", "bultins": "#0099ff", "self": "#b300b3", "func_names": "#0033cc",
+        "strings": "#009900", "comments": "#808080"}
+# Token rules. Strings and comments come first so that words inside of them aren't highlighted
+RULES = [("strings", STRING_REGEX), ("comments", ONE_LINE_COMMENT_REGEX), ("func_names", FUNC_NAME_REGEX)]
+WORDS = [("keywords", KEYWORDS), ("bultins", BUILTINS), ("self", ["self"])]
+# Triple quoted strings are tracked from line to line by the lexer (see SyntaxHighlighter.multiline_tokens)
+MULTILINE_TOKENS = (("strings", STRING_PREFIX + '"""', '"""', True),
+                    ("strings", STRING_PREFIX + "'''", "'''", True))
+
+
+def lexer():
+    """
+    Returns a tokenizer.Lexer for Python source, for use without an editor
+    """
+    return tokenizer.Lexer(RULES, {word: tag_name for tag_name, words in WORDS for word in words}, MULTILINE_TOKENS)
 
 
 class PythonSyntaxHighlighter(SyntaxHighlighter):
+    multiline_tokens = MULTILINE_TOKENS
+
     def __init__(self, text_obj: editor.Editor):
         SyntaxHighlighter.__init__(self, text_obj)
-        self.keywords = ['and', 'as', 'assert', 'break', 'class', 'continue', 'def', 'del', 'elif', 'else', 'except',
-                         'False', 'finally', 'for', 'from', 'global', 'if', 'import', 'in', 'is', 'lambda', 'None',
-                         'nonlocal', 'not', 'or', 'pass', 'raise', 'return', 'True', 'try', 'while', 'with', 'yield']
-
-        self.builtins = list(__builtins__.keys())
-        for keyword in self.keywords:
-            if keyword in self.builtins:
-                self.builtins.remove(keyword)
-
-        self.string_regex = re.compile(r"(?i:r|u|f|fr|rf|b|br|rb)?[\"\'][^\"\'].*?[\"\']")
-        self.one_line_comment_regex = re.compile(r"#.*(?=\n)")
-        self.multiline_comment_regex = re.compile(r"[\"\']{3}.*?[\"\']{3}", re.DOTALL)
-        self.func_name_regex = re.compile(r"(?<=def).*(?=\()")
-
-        # Tags added
-        self.add_tag("keywords", "#cc7a00")
-        self.add_tag("bultins", "#0099ff")
-        self.add_tag("self", "#b300b3")
-        self.add_tag("func_names", "#0033cc")
-        self.add_tag("strings", "#009900")
-        self.add_tag("comments", "#808080")
+        self.keywords = KEYWORDS
+        self.builtins = BUILTINS
+
+        self.string_regex = STRING_REGEX
+        self.one_line_comment_regex = ONE_LINE_COMMENT_REGEX
+        self.func_name_regex = FUNC_NAME_REGEX
+
+        for tag_name, color in TAGS.items():
+            self.add_tag(tag_name, color)
+        for tag_name, pattern in RULES:
+            self.add_rule(tag_name, pattern)
+        for tag_name, words in WORDS:
+            self.add_words(tag_name, words)
 
     def highlight_syntax(self):
-        self._text = self._text_obj.get(0.0, "end")
-        for keyword in self.keywords:
-            self.highlight_word(keyword, "keywords")
-        for builtin in self.builtins:
-            self.highlight_word(builtin, "bultins")
-        self.highlight_word("self", "self")
-        self.highlight_pattern(self.string_regex, "strings")
-        self.highlight_pattern(self.func_name_regex, "func_names")
-        self.highlight_pattern(self.one_line_comment_regex, "comments")
-        self.highlight_pattern(self.multiline_comment_regex, "strings")
-        print(utils.get_tags("48.42", "48.75", self._text_obj))
+        self.highlight_tokens()
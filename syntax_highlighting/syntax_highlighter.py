@@ -6,21 +6,57 @@ Abstract base class for creating custom syntax highlighters
 See syntax_highlighting/python.py for an example implementation
 
 NOTE: While Tkinter has it's own regex engine (it uses TCL's regex engine), I chose to go with the Python's regex
-engine because it's a little more sophisticated than the one provided by Tkinter. If you don't want to use Python's
-regex engine, you can always override the highlight_pattern() method to use whatever regex engine you want. If you're
-dead set on using Tkinter's regex engine, utils.get_string_indexes() supports TCL's regex engine. Just set the
-'regex' option to True.
+engine because it's a little more sophisticated than the one provided by Tkinter, and because searching a single
+snapshot of the text in Python (see utils.find_all_spans()) avoids a round trip to Tcl for every match. If you don't
+want to use Python's regex engine, you can always override the highlight_pattern() method to use whatever regex engine
+you want. If you're dead set on using Tkinter's regex engine, utils.get_string_indexes() supports TCL's regex engine.
+Just set the 'regex' option to True.
 """
 
 
 from abc import ABC, abstractmethod
+from bisect import bisect_right
 import editor
+import profiling
 import utils
+from syntax_highlighting import tokenizer
 import tkinter as tk
+import queue
 import re
+import threading
+import time
 
 
 class SyntaxHighlighter(ABC):
+    # Number of lines above and below an edit that are re-highlighted along with it
+    context_lines = 2
+    # Tokens that can span many lines (e.g. triple quoted strings), as (tag_name, opener, closer, escapes) tuples.
+    # opener is a regex, closer is the literal text that ends the token, and if escapes is True a backslash stops the
+    # next character from closing it. These are tried before the rules added with add_rule().
+    # The lexer remembers the state at the end of every line (normal, or inside one of these tokens), so an edit only
+    # needs to be re-lexed down to the first line whose end state didn't change
+    multiline_tokens = ()
+    # When an edit changes the end state of the last line it re-lexes, the lines below it are re-lexed too, starting
+    # with this many and doubling for as long as the states keep changing
+    state_chunk_lines = 100
+    # Edits are coalesced into a single highlight pass that runs debounce_ms after the first edit of a burst
+    debounce_ms = 30
+    # Longest a highlight pass may keep the event loop busy for, in milliseconds. Longer passes are split into slices
+    frame_budget_ms = 8
+    # When True, highlighters that use add_rule()/add_words() tokenize on a worker thread and the resulting tags are
+    # applied to the editor in slices of at most frame_budget_ms, so typing never waits on the lexer
+    threaded = True
+    # Number of milliseconds between checks for finished tokenizer jobs
+    poll_interval_ms = 10
+    # When True, only the visible lines (plus prefetch_lines above and below) are highlighted right away. Everything
+    # else is highlighted idle_chunk_lines at a time, idle_delay_ms after the last pass, or when it's scrolled to
+    lazy = True
+    prefetch_lines = 100
+    idle_chunk_lines = 1000
+    idle_delay_ms = 100
+    # Worker results are compared with the tags already in the editor and applied this many lines at a time
+    apply_chunk_lines = 500
+
     def __init__(self, text_obj: editor.Editor):
         ABC.__init__(self)
         self._match_length = tk.IntVar()
@@ -28,10 +64,441 @@ class SyntaxHighlighter(ABC):
         self._text_obj = text_obj
         self._patterns = {}
         self._tag_names = []
+        # Token rules as (tag_name, pattern) pairs and words mapped to their tag names. These are compiled into
+        # a single regex by the lexer so the text is only scanned once per highlight pass
+        self._rules = []
+        self._words = {}
+        # tokenizer.Lexer built from the rules, words and multiline tokens, by _get_lexer()
+        self._lexer = None
+        # Region of the text currently being highlighted
+        self._start = "1.0"
+        self._stop = tk.END
+        # Lexer state at the end of every line: 0 for normal, i + 1 inside multiline_tokens[i] and None if the line
+        # hasn't been lexed since it was last changed
+        self._line_states = [None]
+        # Tags applied to every line by the lexer, as tuples of (start column, end column, tag_name) pieces, where an
+        # end column of None means the piece runs on through the newline. None if the tags on the line aren't known
+        # (e.g. it was edited), in which case all of the highlighter's tags are removed from it before retagging
+        self._line_tags = [None]
+        # [first, last] line ranges that were touched by edits since the last highlight pass
+        self._dirty_lines = []
+        # Incremented on every edit. Worker results from an older generation are stale and get thrown away
+        self._generation = 0
+        # [first, last] line ranges that were handed to the worker and haven't been fully applied yet
+        self._pending_lines = []
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._worker = None
+        self._poll_id = None
+        self._apply_id = None
+        self._idle_id = None
+        self._highlight_id = None
+        # Worker results waiting to be tagged, as [generation, line_range, line_tags, position] lists
+        self._applying = []
 
     def get_tag_names(self):
         return self._tag_names
 
+    @staticmethod
+    def _shift_lines(line_ranges, operation, first, last):
+        if operation == 'insert':
+            # Lines below the insert point move down by the number of inserted newlines
+            for line_range in line_ranges:
+                for i in (0, 1):
+                    if line_range[i] > first:
+                        line_range[i] += last - first
+        else:
+            # Lines below the deleted range move up, lines inside of it collapse onto the first line
+            for line_range in line_ranges:
+                for i in (0, 1):
+                    if line_range[i] > last:
+                        line_range[i] -= last - first
+                    elif line_range[i] > first:
+                        line_range[i] = first
+
+    def _on_edit(self, operation, start, end, text, start_offset, end_offset):
+        first = int(start.split('.')[0])
+        last = int(end.split('.')[0])
+        self._generation += 1
+        self._shift_lines(self._dirty_lines, operation, first, last)
+        self._shift_lines(self._pending_lines, operation, first, last)
+        if operation == 'insert':
+            self._line_states[first - 1:first] = [None] * (last - first + 1)
+            self._line_tags[first - 1:first] = [None] * (last - first + 1)
+            self._dirty_lines.append([first, last])
+        else:
+            self._line_states[first - 1:last] = [None]
+            self._line_tags[first - 1:last] = [None]
+            self._dirty_lines.append([first, first])
+        self.schedule_highlight()
+
+    def activate(self, state=None):
+        '''
+        Starts following the editor's edits and highlights the whole document. state can be what save_state() returned
+        for the same text, in which case its tags are put back and only the lines it hadn't highlighted are lexed
+        '''
+        self._text_obj.add_edit_listener(self._on_edit)
+        if state is not None and len(state[0]) == self._text_obj.document.line_count():
+            self._restore_state(state)
+        else:
+            self.mark_all_dirty()
+        self.schedule_highlight()
+
+    def save_state(self):
+        '''
+        Returns the lexer state and tags of every line, and the lines that still need highlighting, so that activate()
+        can put them back onto the same text without lexing it again. None for highlighters that don't keep track of
+        them (see self._line_tags)
+        '''
+        if not self._uses_lexer() or len(self._line_states) != self._text_obj.document.line_count():
+            return None
+        dirty = [list(line_range) for line_range in self._dirty_lines + self._pending_lines]
+        return list(self._line_states), list(self._line_tags), dirty
+
+    def _restore_state(self, state):
+        line_states, line_tags, dirty = state
+        self._line_states = list(line_states)
+        self._line_tags = line_tags[:len(line_states)]
+        self._line_tags.extend([None] * (len(self._line_states) - len(self._line_tags)))
+        self._dirty_lines = [list(line_range) for line_range in dirty]
+        added = {}
+        for line, pieces in enumerate(self._line_tags, 1):
+            if pieces is None or self._line_states[line - 1] is None:
+                if self._dirty_lines and self._dirty_lines[-1][1] == line - 1:
+                    self._dirty_lines[-1][1] = line
+                else:
+                    self._dirty_lines.append([line, line])
+            for start, end, tag_name in pieces or ():
+                added.setdefault(tag_name, []).extend((f"{line}.{start}",
+                                                       f"{line + 1}.0" if end is None else f"{line}.{end}"))
+        # A single tag add call for each tag, with all of its ranges
+        for tag_name, indexes in added.items():
+            self._text_obj.tag_add(tag_name, *indexes)
+
+    def deactivate(self):
+        '''
+        Stops following the editor's edits and removes all of this highlighter's tags
+        '''
+        self._text_obj.remove_edit_listener(self._on_edit)
+        for after_id in (self._poll_id, self._apply_id, self._idle_id, self._highlight_id):
+            if after_id is not None:
+                self._text_obj.after_cancel(after_id)
+        self._poll_id = self._apply_id = self._idle_id = self._highlight_id = None
+        self._generation += 1
+        self._dirty_lines = []
+        self._pending_lines = []
+        self._applying = []
+        self._line_states = [None]
+        self._line_tags = [None]
+        for tag in self._tag_names:
+            self._text_obj.tag_remove(tag, "1.0", tk.END)
+
+    def schedule_highlight(self):
+        if self._highlight_id is None:
+            self._highlight_id = self._text_obj.after(self.debounce_ms, self._scheduled_highlight)
+
+    def _scheduled_highlight(self):
+        self._highlight_id = None
+        self.highlight_dirty()
+
+    def mark_all_dirty(self):
+        self._dirty_lines = [[1, int(self._text_obj.index(tk.END).split('.')[0])]]
+        self._line_states = [None] * self._text_obj.document.line_count()
+        self._line_tags = [None] * self._text_obj.document.line_count()
+
+    def _uses_lexer(self):
+        return bool(self._rules or self._words or self.multiline_tokens)
+
+    def _state_before(self, line):
+        '''
+        Returns the lexer state at the start of a line. The line above it must have been lexed (see _lex_start())
+        '''
+        if line < 2 or line - 2 >= len(self._line_states) or self._line_states[line - 2] is None:
+            return 0
+        return self._line_states[line - 2]
+
+    def _lex_start(self, line):
+        '''
+        Returns the line that lexing has to start at for line to be lexed in the right state: the one after the nearest
+        line above it whose end state is known. A view that opens inside a multiline string that wasn't lexed yet
+        would be highlighted as code otherwise
+        '''
+        line_states = self._line_states
+        while line > 1 and line - 2 < len(line_states) and line_states[line - 2] is None:
+            line -= 1
+        return line
+
+    def _update_states(self, first, last, states):
+        '''
+        Stores the end states of lines first to last from a fresh lex. If the state at the end of the last line
+        changed, the lines below it have to be lexed again
+        '''
+        line_states = self._line_states
+        if last > len(line_states) or len(states) != last - first + 1:
+            return
+        old_state = line_states[last - 1]
+        line_states[first - 1:last] = states
+        if states[-1] != old_state and last < len(line_states):
+            size = min(self.idle_chunk_lines, max(self.state_chunk_lines, 2 * (last - first + 1)))
+            self._dirty_lines.append([last + 1, min(len(line_states), last + size)])
+            self.schedule_highlight()
+
+    def _expand_to_tags(self, first, last):
+        '''
+        Grows the region [first, last] until it no longer cuts through a tagged range (e.g. a multiline string),
+        so that those ranges are re-highlighted as a whole
+        '''
+        changed = True
+        while changed:
+            changed = False
+            for tag in self._tag_names:
+                tag_range = self._text_obj.tag_prevrange(tag, f"{first}.0")
+                if tag_range and self._text_obj.compare(tag_range[1], ">", f"{first}.0"):
+                    first = int(str(tag_range[0]).split('.')[0])
+                    changed = True
+                tag_range = self._text_obj.tag_prevrange(tag, f"{last}.end")
+                if tag_range and self._text_obj.compare(tag_range[1], ">", f"{last}.end"):
+                    last = int(str(tag_range[1]).split('.')[0])
+                    changed = True
+        return first, last
+
+    def visible_lines(self):
+        '''
+        Returns the (first, last) lines shown in the editor, widened by self.prefetch_lines on both sides
+        '''
+        first = int(self._text_obj.index("@0,0").split('.')[0])
+        last = int(self._text_obj.index(f"@0,{self._text_obj.winfo_height()}").split('.')[0])
+        return max(1, first - self.prefetch_lines), last + self.prefetch_lines
+
+    @profiling.timed('highlight')
+    def highlight_dirty(self, window=None):
+        '''
+        Re-highlights only the lines touched by edits since the last pass, plus self.context_lines of margin
+        If window is given as (first, last), or self.lazy is set, only the dirty lines inside of the window (by default
+        the visible lines) are highlighted. The rest stay dirty and are highlighted while the editor is idle
+        '''
+        if not self._dirty_lines:
+            return
+        if window is None and self.lazy:
+            window = self.visible_lines()
+        last_line = int(self._text_obj.index("end-1c").split('.')[0])
+        ranges = sorted((max(1, min(last_line, first - self.context_lines)),
+                         min(last_line, last + self.context_lines)) for first, last in self._dirty_lines)
+        self._dirty_lines = []
+        merged = [list(ranges[0])]
+        for first, last in ranges[1:]:
+            if first <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+        deadline = time.perf_counter() + self.frame_budget_ms / 1000
+        for i, (first, last) in enumerate(merged):
+            if time.perf_counter() > deadline:
+                # Out of time for this frame, pick up the remaining regions in the next pass
+                self._dirty_lines.extend(merged[i:])
+                self.schedule_highlight()
+                break
+            if window is not None and (last < window[0] or first > window[1]):
+                self._dirty_lines.append([first, last])
+                continue
+            region_first, region_last = first, last
+            if window is not None:
+                region_first, region_last = max(first, window[0]), min(last, window[1])
+            if self._uses_lexer():
+                region_first = self._lex_start(region_first)
+            else:
+                # The lexer carries multiline tokens over from line to line by itself, other highlighters need to
+                # see the whole of a multiline match again
+                region_first, region_last = self._expand_to_tags(region_first, region_last)
+            if region_first > first:
+                self._dirty_lines.append([first, region_first - 1])
+            if region_last < last:
+                self._dirty_lines.append([region_last + 1, last])
+            self.highlight_region(region_first, region_last)
+        if self._dirty_lines:
+            self._schedule_idle()
+
+    def _schedule_idle(self):
+        if self._idle_id is None:
+            self._idle_id = self._text_obj.after(self.idle_delay_ms, self._highlight_idle)
+
+    def _highlight_idle(self):
+        '''
+        Highlights the next self.idle_chunk_lines dirty lines, one chunk at a time, until nothing is left
+        '''
+        self._idle_id = None
+        if not self._dirty_lines:
+            return
+        if self._pending_lines:
+            # Wait for the worker to catch up before giving it more to do
+            self._schedule_idle()
+            return
+        first = min(line_range[0] for line_range in self._dirty_lines)
+        self.highlight_dirty(window=(first, first + self.idle_chunk_lines - 1))
+
+    def highlight_region(self, first, last):
+        '''
+        Highlights lines first to last (inclusive) again
+        Highlighters that use add_rule()/add_words() only update the tags that changed (see _apply_line_tags()), for
+        the others the highlighter's tags are cleared from the lines first
+        '''
+        if self.threaded and self._uses_lexer():
+            self._submit(first, last)
+            return
+        self._start = f"{first}.0"
+        self._stop = f"{last}.end"
+        if not self._uses_lexer():
+            for tag in self._tag_names:
+                self._text_obj.tag_remove(tag, self._start, f"{last + 1}.0")
+        self._text = self._text_obj.document.get_lines(first, last)
+        self.highlight_syntax()
+
+    def _submit(self, first, last):
+        '''
+        Hands lines first to last over to the worker thread, which reads them from a snapshot of the document
+        '''
+        # The worker gets the lexer with the job, so that adding rules in the meantime can't change it under it
+        lexer = self._get_lexer()
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._work, daemon=True)
+            self._worker.start()
+        line_range = [first, last]
+        self._pending_lines.append(line_range)
+        # line_range is shifted by later edits, so the worker gets the lines as they are now
+        self._jobs.put((self._generation, line_range, (first, last), self._text_obj.document.snapshot(),
+                        self._state_before(first), lexer))
+        self._schedule_poll()
+
+    def _work(self):
+        '''
+        Runs on the worker thread. This must never touch the text widget
+        '''
+        while True:
+            generation, line_range, lines, snapshot, start_state, lexer = self._jobs.get()
+            if generation != self._generation:
+                line_tags = states = None
+            else:
+                text = snapshot.get_lines(*lines)
+                spans, states = lexer.lex(text, start_state)
+                line_tags = self.line_tags(text, spans)
+            self._results.put((generation, line_range, line_tags, states))
+
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self._text_obj.after(self.poll_interval_ms, self._poll_results)
+
+    def _discard(self, line_range):
+        # Ranges that are no longer pending were dropped by deactivate() and don't need highlighting anymore
+        if line_range in self._pending_lines:
+            self._pending_lines.remove(line_range)
+            self._dirty_lines.append(line_range)
+
+    def _poll_results(self):
+        self._poll_id = None
+        stale = False
+        while True:
+            try:
+                generation, line_range, line_tags, states = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if line_tags is None or generation != self._generation:
+                self._discard(line_range)
+                stale = True
+            else:
+                self._update_states(line_range[0], line_range[1], states)
+                self._applying.append([generation, line_range, line_tags, 0])
+        if self._applying and self._apply_id is None:
+            self._apply_results()
+        if stale:
+            # The text changed under those results, so highlight their lines again from a fresh snapshot
+            self.highlight_dirty()
+        if self._pending_lines:
+            self._schedule_poll()
+
+    @profiling.timed('highlight')
+    def _apply_results(self):
+        '''
+        Tags worker results in the editor until frame_budget_ms runs out, then lets the event loop catch up
+        '''
+        self._apply_id = None
+        deadline = time.perf_counter() + self.frame_budget_ms / 1000
+        while self._applying:
+            result = self._applying[0]
+            generation, line_range, line_tags, position = result
+            if generation != self._generation:
+                self._applying.pop(0)
+                self._discard(line_range)
+                continue
+            first = line_range[0]
+            while position < len(line_tags):
+                self._apply_line_tags(first + position, line_tags[position:position + self.apply_chunk_lines])
+                position += self.apply_chunk_lines
+                result[3] = position
+                if time.perf_counter() > deadline and position < len(line_tags):
+                    self._apply_id = self._text_obj.after(1, self._apply_results)
+                    return
+            self._applying.pop(0)
+            self._pending_lines.remove(line_range)
+
+    @staticmethod
+    def line_tags(text, spans):
+        '''
+        Splits (start, end, tag_name) spans from lex() into the pieces on each line of text (see self._line_tags)
+        Returns a tuple of pieces for every line of text
+        '''
+        line_starts = utils.get_line_starts(text)
+        lines = [[] for _ in line_starts]
+        for start, end, tag_name in spans:
+            line = bisect_right(line_starts, start) - 1
+            column = start - line_starts[line]
+            while line + 1 < len(line_starts) and end >= line_starts[line + 1]:
+                lines[line].append((column, None, tag_name))
+                line += 1
+                column = 0
+            if end > line_starts[line] + column:
+                lines[line].append((column, end - line_starts[line], tag_name))
+        return [tuple(pieces) for pieces in lines]
+
+    def _apply_line_tags(self, first, line_tags):
+        '''
+        Updates the tags of the lines starting at first to line_tags (see line_tags()). Only the pieces that differ
+        from what's already on a line are removed or added, and each tag takes a single tag remove and tag add call
+        with all of its ranges, so lines that didn't change cost nothing
+        '''
+        old_tags = self._line_tags
+        if first - 1 + len(line_tags) > len(old_tags):
+            # Lines this highlighter hasn't seen yet
+            old_tags.extend([None] * (first - 1 + len(line_tags) - len(old_tags)))
+        removed = {}
+        added = {}
+        unknown = []
+        for line, new in enumerate(line_tags, first):
+            old = old_tags[line - 1]
+            if old == new:
+                continue
+            old_tags[line - 1] = new
+            if old is None:
+                if unknown and unknown[-1][1] == line - 1:
+                    unknown[-1][1] = line
+                else:
+                    unknown.append([line, line])
+                old = ()
+            old_set = set(old)
+            new_set = set(new)
+            for pieces, out in ((old_set - new_set, removed), (new_set - old_set, added)):
+                for start, end, tag_name in pieces:
+                    out.setdefault(tag_name, []).extend((f"{line}.{start}",
+                                                         f"{line + 1}.0" if end is None else f"{line}.{end}"))
+        for unknown_first, unknown_last in unknown:
+            for tag_name in self._tag_names:
+                removed.setdefault(tag_name, []).extend((f"{unknown_first}.0", f"{unknown_last + 1}.0"))
+        # Tkinter's tag_remove() only takes a single range, Tk's takes any number of them
+        widget = self._text_obj
+        for tag_name, indexes in removed.items():
+            widget.tk.call(widget._w, 'tag', 'remove', tag_name, *indexes)
+        for tag_name, indexes in added.items():
+            widget.tag_add(tag_name, *indexes)
+
     def add_tag(self, tag_name: str, color: str):
         '''
         Interface for adding a tag from the editor
@@ -57,6 +524,53 @@ class SyntaxHighlighter(ABC):
         else:
             return False
 
+    def add_rule(self, tag_name: str, pattern: str):
+        '''
+        Adds a token rule. Rules are tried in the order they were added, the first one that matches at a position wins
+        '''
+        self._rules.append((tag_name, pattern))
+        self._lexer = None
+
+    def add_words(self, tag_name: str, words):
+        '''
+        Highlights every whole word in words with the tag given by tag_name.
+        Words are matched after all the rules added with add_rule()
+        '''
+        for word in words:
+            self._words[word] = tag_name
+        self._lexer = None
+
+    def _get_lexer(self):
+        '''
+        Returns the Lexer built from the rules, words and multiline tokens, building it if they changed
+        '''
+        if self._lexer is None:
+            self._lexer = tokenizer.Lexer(self._rules, self._words, self.multiline_tokens)
+        return self._lexer
+
+    def lex(self, text, start_state=0):
+        '''
+        Tokenizes text, which starts in start_state (see self._line_states and tokenizer.Lexer.lex())
+        '''
+        return self._get_lexer().lex(text, start_state)
+
+    def tokenize(self, text):
+        '''
+        Walks the text once and yields a (start, end, tag_name) span for every token found.
+        start and end are character offsets into text
+        '''
+        yield from self.lex(text)[0]
+
+    def highlight_tokens(self):
+        '''
+        Tokenizes self._text and tags the tokens in the editor. Only the tags that changed since the region was last
+        highlighted are updated (see _apply_line_tags())
+        '''
+        first = int(self._start.split('.')[0])
+        spans, states = self.lex(self._text, self._state_before(first))
+        self._update_states(first, first + len(states) - 1, states)
+        self._apply_line_tags(first, self.line_tags(self._text, spans))
+
     def highlight_pattern(self, pattern: re.Pattern, tag_name):
         '''
         Highlights a section of text given an re.Pattern object with the tag given by tag_name
@@ -64,13 +578,17 @@ class SyntaxHighlighter(ABC):
             (True, matches) if a match or matches were found
             False if no matches were found
         '''
-        matches = re.findall(pattern, self._text)
+        document = self._text_obj.document
+        base = document.index_to_offset(self._start)
+        matches = []
+        indexes = []
+        for match in re.finditer(pattern, self._text):
+            matches.append(match.group())
+            indexes.extend((document.offset_to_index(base + match.start()),
+                            document.offset_to_index(base + match.end())))
         if not matches:
             return False
-        for match in matches:
-            indexes = utils.get_string_indexes(match, self._text_obj)
-            for index in indexes:
-                self._text_obj.tag_add(tag_name, index[0], index[1])
+        self._text_obj.tag_add(tag_name, *indexes)
         return True, matches
 
     def highlight_word(self, word, tag_name):
@@ -80,17 +598,21 @@ class SyntaxHighlighter(ABC):
             (True, indexes) if a the word was found
             False if the word was not found in the text
         '''
-        indexes = utils.get_string_indexes(f"\\m{word}\\M", self._text_obj, regex=True)
+        indexes = utils.find_all_spans(utils.compile_search(word, match_word=True), self._text_obj,
+                                       start=self._start, stop=self._stop)
         if not indexes:
             return False
-        for index in indexes:
-            self._text_obj.tag_add(tag_name, index[0], index[1])
+        self._text_obj.tag_add(tag_name, *[index for span in indexes for index in span])
         return True, indexes
 
     @abstractmethod
     def highlight_syntax(self):
         '''
         This is the method called when syntax highlighting takes place (in Main.update_syntax_highlighting)
-        self._text should always assigned here first with self._text_obj.get("0.0", "end")
+        Only the region between self._start and self._stop needs to be highlighted. self._text is already assigned
+        to the text of that region by highlight_region()
+        NOTE: Highlighters that only use add_rule() and add_words() are tokenized on a worker thread instead
+        (see SyntaxHighlighter.threaded), this is only called when that is turned off or no rules were added.
+        When rules were added the region's tags aren't cleared beforehand, highlight_tokens() updates them in place
         '''
         pass
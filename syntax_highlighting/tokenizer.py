@@ -0,0 +1,121 @@
+"""
+Tokenizer for tkEdit
+
+The lexing core of the syntax highlighters. It only works on strings and doesn't depend on Tk or the editor, so it
+can be used without a display (e.g. by export.py) and tested on its own. SyntaxHighlighter builds a Lexer from its
+rules and turns the spans it returns into tags
+"""
+
+import re
+
+
+def token_pattern(rules, has_words, multiline_tokens=()):
+    """
+    Combines token rules into the source of the single regex used by Lexer. Each rule gets its own group, named
+    after its position, openers of multiline tokens come first and words are picked up by a final \\w+ group
+    """
+    patterns = [f"(?P<_m{i}>{token[1]})" for i, token in enumerate(multiline_tokens)]
+    patterns.extend(f"(?P<_{i}>{pattern})" for i, (_, pattern) in enumerate(rules))
+    if has_words:
+        patterns.append(r"(?P<_word>\w+)")
+    return "|".join(patterns)
+
+
+class Lexer:
+    """
+    Splits text into tokens with a list of (token_type, pattern) rules, a dict of words mapped to their token types and
+    (token_type, opener, closer, escapes) multiline tokens (see SyntaxHighlighter.multiline_tokens).
+    pattern can be given if the rules were already combined with token_pattern()
+    """
+    def __init__(self, rules=(), words=None, multiline_tokens=(), pattern=None):
+        self.rules = [tuple(rule) for rule in rules]
+        self.words = dict(words or {})
+        self.multiline_tokens = tuple(tuple(token) for token in multiline_tokens)
+        if pattern is None:
+            pattern = token_pattern(self.rules, bool(self.words), self.multiline_tokens)
+        self.regex = re.compile(pattern)
+        self.closers = [re.compile((r"\\[\s\S]|" if escapes else "") + re.escape(closer))
+                        for _, _, closer, escapes in self.multiline_tokens]
+
+    def _find_closer(self, state, text, position):
+        """
+        Returns the offset just past the closer of the multiline token for state, or None if it isn't closed in text
+        """
+        for match in self.closers[state - 1].finditer(text, position):
+            if match.group()[0] == "\\" and self.multiline_tokens[state - 1][3]:
+                continue
+            return match.end()
+        return None
+
+    def lex(self, text, start_state=0):
+        """
+        Tokenizes text, which starts in start_state: 0 for normal or i + 1 inside of multiline_tokens[i]
+        Returns (spans, states) where spans is a list of (start, end, token_type) tokens with start and end being
+        character offsets into text, and states holds the lexer state at the end of each line of text
+        """
+        words = self.words
+        rules = self.rules
+        length = len(text)
+        spans = []
+        # Multiline tokens as (start, end, state). end is None if the token isn't closed by the end of text
+        regions = []
+        position = 0
+        if start_state:
+            end = self._find_closer(start_state, text, 0)
+            spans.append((0, length if end is None else end, self.multiline_tokens[start_state - 1][0]))
+            regions.append((-1, end, start_state))
+            position = length if end is None else end
+        # Without any rules the pattern is empty and would match everywhere
+        while position < length and self.regex.groups:
+            # finditer() is restarted after every multiline token, since it has to skip over the whole token
+            restart = None
+            for match in self.regex.finditer(text, position):
+                group = match.lastgroup
+                if group == "_word":
+                    token_type = words.get(match.group())
+                    if token_type is None:
+                        continue
+                elif group[1] == "m":
+                    state = int(group[2:]) + 1
+                    end = self._find_closer(state, text, match.end())
+                    spans.append((match.start(), length if end is None else end, self.multiline_tokens[state - 1][0]))
+                    regions.append((match.start(), end, state))
+                    restart = length if end is None else end
+                    break
+                else:
+                    token_type = rules[int(group[1:])][0]
+                spans.append((match.start(), match.end(), token_type))
+            if restart is None:
+                break
+            position = restart
+
+        states = []
+        region = 0
+        line_start = 0
+        while True:
+            line_end = text.find("\n", line_start)
+            if line_end == -1:
+                line_end = length
+            while region < len(regions) and regions[region][1] is not None and regions[region][1] <= line_end:
+                region += 1
+            if region < len(regions) and regions[region][0] < line_end:
+                states.append(regions[region][2])
+            else:
+                states.append(0)
+            if line_end == length:
+                break
+            line_start = line_end + 1
+        return spans, states
+
+    def tokenize(self, text):
+        """
+        Returns an (offset, length, token_type) span for every token in text
+        """
+        return [(start, end - start, token_type) for start, end, token_type in self.lex(text)[0]]
+
+
+def tokenize(text, rules=(), words=None, multiline_tokens=()):
+    """
+    Returns an (offset, length, token_type) span for every token in text (see Lexer)
+    """
+    return Lexer(rules, words, multiline_tokens).tokenize(text)
@@ -0,0 +1,39 @@
+import os
+
+
+class Tab:
+    """
+    One open document. Only the selected tab's text is held by the editor. The others are kept in a compact form until
+    they're selected again (see FileMenu.stash_tab() and FileMenu.restore_tab()): the path of their file, with any
+    unsaved changes left in the file's edit journal (see journal.py), which is replayed onto the file when the tab is
+    restored, and the edits in their undo history (see Editor.history), from which the undo history is rebuilt. Only
+    documents whose changes can't be journaled (e.g. ones that were never saved, or whose file was changed by
+    another program) keep a snapshot of their text
+    """
+    def __init__(self, filepath='Untitled.txt'):
+        self.filepath = filepath
+        self.modified = False
+        self.read_only = False
+        # document.Snapshot of the text, for modified documents without a journal
+        self.snapshot = None
+        # Editor.history of the document, if it had any undo history
+        self.history = None
+        # Lexer states and tags of every line (see SyntaxHighlighter.save_state()), so the text isn't lexed again when
+        # the tab is selected. It takes a tuple for every line, which is still much less than the text's Tk tags
+        self.highlighting = None
+        # (size, modification time) of the file when the tab was left, which tells whether highlighting still fits it
+        self.file_stat = None
+        # Where the cursor and the view were when the tab was last selected
+        self.cursor = '1.0'
+        self.scroll = 0.0
+        # The empty page that stands for the tab in the tab bar. Every tab shares the one editor
+        self.frame = None
+
+    @property
+    def filename(self):
+        return os.path.split(self.filepath)[-1]
+
+    def title(self):
+        if self.read_only:
+            return f'{self.filename} (read only)'
+        return f'*{self.filename}' if self.modified else self.filename
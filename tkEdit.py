@@ -4,39 +4,74 @@ Written by Joshua Kitchen - March 2021, revised March 2023
 A text editor app implemented in Tkinter.
 """
 
+import time
+# Taken before anything else is imported, for --startup-timing
+STARTED = time.perf_counter()
+
+import argparse
+import importlib
 import os
 import sys
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import messagebox
 
-import utils
 from editor import Editor
 from menus.file_menu import FileMenu
 from menus.edit_menu import EditMenu
 from menus.format_menu import FormatMenu
+import profiling
+import tabs
+import utils
 from status_bar import StatusBar
-from syntax_highlighting.python import PythonSyntaxHighlighter
 
 
 class Main(tk.Tk):
-    def __init__(self, in_file=None):
+    # Syntax highlighters by file extension, as (module, class name). They're imported and created on first use.
+    # Other extensions are looked up in the grammar files (see syntax_highlighting/grammar.py)
+    syntax_highlighter_classes = {"py": ("syntax_highlighting.python", "PythonSyntaxHighlighter")}
+
+    def __init__(self, in_files=()):
         tk.Tk.__init__(self)
+        profiling.startup.mark('Tk')
 
         self.FIND_AND_REP_WIN = None
         self.FONT_CHOOSE_WIN = None
+        self.FIND_IN_FILES_WIN = None
+        self._syntax_highlighter = None
+        # Files of at least this many bytes are opened read-only in a LargeFileViewer instead of the editor
+        self.large_file_threshold = 256 * 1024 * 1024
+        self.viewer = None
+        # Where the latencies collected with --profile are written on close
+        self.profile_path = 'tkedit-profile.json'
+        # Status and title updates are coalesced into at most one every status_update_ms
+        self.status_update_ms = 16
+        self._status_update_id = None
+
+        # Open documents. Only the active tab's document is in the editor (see tabs.Tab)
+        self.tabs = []
+        self.active_tab = None
 
         self.geometry('1000x500')
         self.protocol('WM_DELETE_WINDOW', self.close)
 
+        self.tab_bar = ttk.Notebook(self)
+        self.tab_bar.enable_traversal()
+        self.tab_bar.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+
         self.editor_frame = tk.Frame(self)
         self.editor_frame.pack_propagate(False)
         self.editor = Editor(self.editor_frame)
 
-        self.scrollbar = ttk.Scrollbar(self, command=self.editor.yview, cursor='arrow')
-        self.editor.configure(yscrollcommand=self.scrollbar.set, relief=tk.FLAT)
+        self.scrollbar = ttk.Scrollbar(self, command=self.on_scrollbar, cursor='arrow')
+        self.editor.configure(yscrollcommand=self.on_editor_scroll, relief=tk.FLAT)
 
         self.status = StatusBar(self)
+        self.totals = utils.TextTotals(self.editor)
+        self.editor.add_edit_listener(self.on_edit)
+        self.editor.add_cursor_listener(self.schedule_status_update)
+        self.editor.bind('<<Modified>>', self.schedule_status_update, add='+')
+        self.editor.bind('<<Selection>>', self.schedule_status_update, add='+')
 
         self.main_menu = tk.Menu(self)
         self.file_menu = FileMenu(self)
@@ -48,80 +83,314 @@ class Main(tk.Tk):
         self.configure(menu=self.main_menu)
 
         self.status.pack(side=tk.BOTTOM, fill=tk.X)
+        self.tab_bar.pack(side=tk.TOP, fill=tk.X)
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.editor.pack(fill=tk.BOTH, expand=True)
         self.editor_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
         self.bind('<F5>', self.edit_menu.add_timestamp)
         self.bind('<Control_L>f', self.edit_menu.find_and_replace)
+        self.bind('<Control_L>F', self.edit_menu.find_in_files)
         self.bind('<Control_L>o', self.file_menu.open_from_filemanager)
         self.bind('<Control_L>s', self.file_menu.save)
         self.bind('<Control_L>n', self.file_menu.new_file)
-        self.bind("<Key>", self.update_syntax_highlighting)
+        self.bind('<Control_L>w', self.file_menu.close_tab)
 
-        self._syntax_highlighter = None
-        self._syntax_highlighters = {"py": PythonSyntaxHighlighter(self.editor)}
+        self._syntax_highlighters = {}
 
-        self.in_file = in_file
-        if in_file:
-            self.file_menu.open_file(self.in_file)
-        self.title(self.file_menu.filename)
+        self.in_files = list(in_files)
+        self.add_tab(tabs.Tab())
         self.update_gui()
+        profiling.startup.mark('widgets')
+        # Everything else waits until the window has been drawn
+        self.update_idletasks()
+        profiling.startup.mark('first paint')
+        self.after_idle(self.finish_startup)
+
+    def finish_startup(self):
+        self.file_menu.validate_recent_files()
+        if self.in_files:
+            self.file_menu.open_file(self.in_files[0])
+            # The other files only get a tab, they're loaded once they're selected
+            for path in self.in_files[1:]:
+                if self.find_tab(os.path.abspath(path)) is None:
+                    self.add_tab(tabs.Tab(os.path.abspath(path)), select=False)
+        if profiling.profiler.enabled:
+            profiling.profiler.watch_keys(self.editor)
+            self.update_profile_status()
+        profiling.startup.mark('deferred work')
+        profiling.startup.report()
+
+    def find_tab(self, filepath):
+        for tab in self.tabs:
+            if tab.filepath == filepath or (tab is self.active_tab and self.file_menu.filepath == filepath):
+                return tab
+        return None
 
-    def set_syntax_highlighter(self, extension):
-        try:
-            self._syntax_highlighter = self._syntax_highlighters[extension]
-        except KeyError:
-            self._syntax_highlighter = None
+    def active_tab_is_blank(self):
+        '''
+        Returns True if the active tab holds a new document that nothing was typed into, which files are opened in
+        instead of a new tab
+        '''
+        return (not os.path.isabs(self.file_menu.filepath) and not self.editor.edit_modified()
+                and self.viewer is None and self.editor.document.length() == 0)
+
+    def add_tab(self, tab, select=True):
+        tab.frame = tk.Frame(self.tab_bar, height=1)
+        self.tabs.append(tab)
+        self.tab_bar.add(tab.frame, text=tab.title())
+        if select:
+            self.select_tab(tab)
+
+    def select_tab(self, tab):
+        '''
+        Swaps the active tab's document out of the editor and tab's document in
+        '''
+        if tab is self.active_tab:
+            return
+        if isinstance(self.FIND_AND_REP_WIN, tk.Toplevel):
+            self.FIND_AND_REP_WIN.destroy()
+        if isinstance(self.FONT_CHOOSE_WIN, tk.Toplevel):
+            self.FONT_CHOOSE_WIN.destroy()
+        previous = self.active_tab
+        if previous is not None:
+            self.file_menu.stash_tab(previous)
+            self.tab_bar.tab(previous.frame, text=previous.title())
+        self.active_tab = tab
+        self.tab_bar.select(tab.frame)
+        self.file_menu.restore_tab(tab)
+        self.schedule_status_update()
+
+    def on_tab_changed(self, event):
+        selected = self.tab_bar.select()
+        for tab in self.tabs:
+            if str(tab.frame) == selected:
+                self.select_tab(tab)
+                return
+
+    def close_tab(self, tab=None):
+        '''
+        Closes a tab (by default the active one), asking to save its changes first
+        Returns False if the user cancelled
+        '''
+        tab = tab or self.active_tab
+        if tab is not self.active_tab:
+            if tab.modified or tab.snapshot is not None:
+                self.select_tab(tab)
+            else:
+                self.file_menu.discard_tab(tab)
+                self.tabs.remove(tab)
+                self.tab_bar.forget(tab.frame)
+                tab.frame.destroy()
+                return True
+        if not self.file_menu.ask_to_save():
+            return False
+        self.file_menu.cancel_loading()
+        # Whatever is left unsaved was thrown away, and so is the undo history
+        self.editor.edit_modified(False)
+        self.editor.edit_reset()
+        self.file_menu.stash_tab(tab)
+        self.active_tab = None
+        index = self.tabs.index(tab)
+        self.tabs.remove(tab)
+        self.tab_bar.forget(tab.frame)
+        tab.frame.destroy()
+        if self.tabs:
+            self.select_tab(self.tabs[min(index, len(self.tabs) - 1)])
+        else:
+            self.add_tab(tabs.Tab())
+        return True
+
+    def update_tab_title(self):
+        '''
+        Brings the active tab's path, modified flag and label up to date with the editor
+        '''
+        tab = self.active_tab
+        if tab is None:
+            return
+        tab.filepath = self.file_menu.filepath
+        self.filename = tab.filename
+        tab.modified = bool(self.editor.edit_modified())
+        tab.read_only = self.viewer is not None
+        title = tab.title()
+        if self.tab_bar.tab(tab.frame, 'text') != title:
+            self.tab_bar.tab(tab.frame, text=title)
+
+    def get_syntax_highlighter(self, extension):
+        '''
+        Returns the syntax highlighter for a file extension, creating it the first time it's needed, or None
+        '''
+        if extension not in self._syntax_highlighters:
+            highlighter = None
+            if extension in self.syntax_highlighter_classes:
+                module_name, class_name = self.syntax_highlighter_classes[extension]
+                highlighter = getattr(importlib.import_module(module_name), class_name)(self.editor)
+            else:
+                from syntax_highlighting import grammar
+                try:
+                    highlighter = grammar.highlighter_for_extension(self.editor, extension)
+                except (OSError, grammar.GrammarError) as e:
+                    messagebox.showerror('Error', f'Could not load the syntax highlighting for .{extension} files\n{e}')
+            self._syntax_highlighters[extension] = highlighter
+        return self._syntax_highlighters[extension]
+
+    def set_syntax_highlighter(self, extension, state=None):
+        '''
+        Switches to the syntax highlighter for a file extension. state is passed on to SyntaxHighlighter.activate()
+        '''
+        highlighter = self.get_syntax_highlighter(extension) if extension is not None else None
+        if highlighter is self._syntax_highlighter and state is None:
+            return
+        if self._syntax_highlighter is not None:
+            self._syntax_highlighter.deactivate()
+        self._syntax_highlighter = highlighter
+        if highlighter is not None:
+            highlighter.activate(state)
+
+    def syntax_highlighting_state(self):
+        '''
+        Returns what the active syntax highlighter knows about the text (see SyntaxHighlighter.save_state()), or None
+        '''
+        if self._syntax_highlighter is None:
+            return None
+        return self._syntax_highlighter.save_state()
 
     def update_syntax_highlighting(self, *args):
         if self._syntax_highlighter is not None:
-            for tag in self._syntax_highlighter.get_tag_names():
-                utils.clear_tags(tag, self.editor)
-            self._syntax_highlighter.highlight_syntax()
+            self._syntax_highlighter.highlight_dirty()
             self.update_idletasks()
 
+    def open_large_file(self, filepath):
+        self.close_large_file()
+        from large_file_viewer import LargeFileViewer
+        self.viewer = LargeFileViewer(self.editor, filepath)
+
+    def close_large_file(self):
+        if self.viewer is not None:
+            self.viewer.close()
+            self.viewer = None
+
+    def on_scrollbar(self, *args):
+        if self.viewer is not None:
+            self.viewer.yview(*args)
+        else:
+            self.editor.yview(*args)
+
+    def on_editor_scroll(self, first, last):
+        if self.viewer is not None:
+            fractions = self.viewer.on_scroll(first, last)
+            if fractions is not None:
+                self.scrollbar.set(*fractions)
+            return
+        self.scrollbar.set(first, last)
+        # Lines that were scrolled into view may not have been highlighted yet
+        if self._syntax_highlighter is not None:
+            self._syntax_highlighter.schedule_highlight()
+
+    def on_edit(self, *args):
+        self.totals.apply_edit(*args)
+        self.schedule_status_update()
+
+    def schedule_status_update(self, *args):
+        if self._status_update_id is None:
+            self._status_update_id = self.after(self.status_update_ms, self.update_gui)
+
     def update_gui(self):
+        self._status_update_id = None
         if self.editor.edit_modified():
             self.filename = os.path.split(self.file_menu.filepath)[-1]
             self.title(f'*{self.filename}')
 
         index = self.editor.index(tk.INSERT)
         index = index.split('.')
-        self.status.update_line_and_col(index[0], index[1])
-        # Update the GUI every 100 milliseconds
-        self.after(100, self.update_gui)
+        if self.viewer is not None:
+            # Only a window of the file is loaded, so the line number is relative to the start of that window
+            index[0] = int(index[0]) + self.viewer.first_line - 1
+            # The totals would only be the ones of the loaded window
+            totals = None
+        else:
+            totals = (self.totals.line_count(), self.totals.words, self.totals.chars)
+        self.update_tab_title()
+        selected = 0
+        selection = self.editor.tag_ranges(tk.SEL)
+        if selection:
+            selected = (self.editor.document.index_to_offset(selection[1])
+                        - self.editor.document.index_to_offset(selection[0]))
+        self.status.update_status(index[0], index[1], selected, totals)
+
+    def update_profile_status(self):
+        self.status.set_profile(profiling.profiler.status_text())
+        self.after(500, self.update_profile_status)
 
     def close(self):
-        self.file_menu.store_recent_files()
-        if self.editor.edit_modified() == 0:
-            self.editor.update_config()
-            self.quit()
-        else:
-            answer = messagebox.askyesnocancel(title='Save?', message=f'Do you want to save {self.filename}'
-                                                                      f' before quitting?')
-            if answer:
-                self.file_menu.save()
-                self.editor.update_config()
-                self.quit()
-            elif answer is None:
+        if profiling.profiler.enabled:
+            try:
+                profiling.profiler.dump(self.profile_path)
+            except OSError:
+                pass
+        if isinstance(self.FIND_IN_FILES_WIN, tk.Toplevel):
+            # Stops its search and worker processes
+            self.FIND_IN_FILES_WIN.destroy()
+        self.file_menu.wait_for_save()
+        # A partially loaded file must not be offered for saving
+        self.file_menu.cancel_loading()
+        # Every tab with unsaved changes is brought up in turn to ask about them
+        for tab in [self.active_tab] + [tab for tab in self.tabs if tab is not self.active_tab]:
+            if tab is not self.active_tab:
+                if not tab.modified and tab.snapshot is None:
+                    self.file_menu.discard_tab(tab)
+                    continue
+                self.select_tab(tab)
+            if not self.file_menu.ask_to_save():
                 return
-            else:
-                self.editor.update_config()
-                self.quit()
+            # The changes were either saved or thrown away
+            self.editor.stop_journal(delete=True)
+            self.editor.edit_modified(False)
+        self.close_large_file()
+        self.file_menu.store_recent_files()
+        self.editor.update_config()
+        self.quit()
+
+
+def positive_int(value):
+    '''
+    argparse type for options that need a number above zero
+    '''
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value!r} is not a whole number')
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive number')
+    return number
 
 
 def main():
-    args = sys.argv
-    if len(args) > 2:
-        print("Usage: tkEdit.py [filepath]")
-        return
-    elif len(args) == 1:
-        m = Main()
-    else:
-        m = Main(args[1])
+    parser = argparse.ArgumentParser(prog='tkEdit.py')
+    parser.add_argument('filepath', nargs='*', help='files to open in tabs, or with --export the files to export')
+    parser.add_argument('--profile', action='store_true',
+                        help='time key handling, highlighting, find and file I/O and show the latencies')
+    parser.add_argument('--startup-timing', action='store_true', help='print how long each phase of startup took')
+    parser.add_argument('--profile-capture', type=float, metavar='MS',
+                        help='with --profile, capture the first event that takes at least MS milliseconds with '
+                             'cProfile')
+    parser.add_argument('--export', choices=('html', 'ansi'),
+                        help='write the files as syntax highlighted HTML or ANSI text without opening a window')
+    parser.add_argument('--output', default='export', metavar='DIR', help='where --export writes its files')
+    parser.add_argument('--jobs', type=positive_int, metavar='N', help='number of worker processes for --export')
+    args = parser.parse_args()
+    if args.export:
+        import export
+        return 1 if export.export_files(args.filepath, args.export, args.output, args.jobs) else 0
+    if args.startup_timing:
+        profiling.startup.enable(STARTED)
+        profiling.startup.mark('imports')
+    if args.profile or args.profile_capture is not None:
+        profiling.profiler.enable(args.profile_capture)
+    m = Main(args.filepath)
     m.mainloop()
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
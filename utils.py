@@ -1,56 +1,103 @@
+from bisect import bisect_left, bisect_right
+import re
+import sys
 import tkinter as tk
 
+import profiling
 
-def get_first_string_index(string, text_widget, regex=False, no_case=False, start="1.0"):
+
+def get_first_string_index(string, text_widget, regex=False, no_case=False, start="1.0", stop=tk.END):
     """
     A helper function that finds the start and end index of the FIRST instance of a string within a text widget
     """
     length = tk.IntVar()
-    word_start = text_widget.search(string, start, regexp=regex, stopindex=tk.END, nocase=no_case, count=length)
+    word_start = text_widget.search(string, start, regexp=regex, stopindex=stop, nocase=no_case, count=length)
     if word_start == '':
         return None
-    word_start_index = word_start.split(".")
-    start_row = int(word_start_index[0])
-    start_column = int(word_start_index[1])
-    end_row = start_row + string.count('\n')
-    end_column = start_column + length.get()
-    word_end = f"{end_row}.{end_column}"
+    word_end = text_widget.index(f"{word_start}+{length.get()}c")
     return word_start, word_end
 
 
-def get_string_indexes(string, text_widget, regex=False, no_case=False, start="1.0"):
+def get_string_indexes(string, text_widget, regex=False, no_case=False, start="1.0", stop=tk.END):
     """
     A helper function that finds the start and end indexes of ALL instances of a string within a text widget
+    The search can be limited to a region of the text with the start and stop indexes
     """
     length = tk.IntVar()
     out = []
-    while start != text_widget.index(tk.END):
-        word_start = text_widget.search(string, start, regexp=regex, stopindex=tk.END, nocase=no_case, count=length)
+    stop = text_widget.index(stop)
+    while start != stop:
+        word_start = text_widget.search(string, start, regexp=regex, stopindex=stop, nocase=no_case, count=length)
         if word_start == '':
             break
-        word_start_index = word_start.split(".")
-        start_row = int(word_start_index[0])
-        start_column = int(word_start_index[1])
-        end_row = start_row + string.count('\n')
-        end_column = start_column + length.get()
-        word_end = f"{end_row}.{end_column}"
-        start = word_end
+        # The match length is counted in characters, so let Tk work out where it ends (it may span lines)
+        word_end = text_widget.index(f"{word_start}+{length.get()}c")
+        start = word_end if length.get() else text_widget.index(f"{word_start}+1c")
         out.append((word_start, word_end))
     return out
 
 
+def compile_search(string, regex=False, no_case=False, match_word=False):
+    """
+    A helper function that compiles a search string into a Python regex for find_all_spans() and find_first_span()
+    """
+    pattern = string if regex else re.escape(string)
+    if match_word:
+        pattern = f"(?<!\\w)(?:{pattern})(?!\\w)"
+    return re.compile(pattern, re.IGNORECASE if no_case else 0)
+
+
+def _search_snapshot(text_widget, start, stop):
+    """
+    Returns a snapshot of the text between start and stop, something that converts offsets into it to indexes (see
+    LineIndex) and the offset of start
+    The text is read from the widget's document (see editor.Editor) when it has one
+    """
+    start = text_widget.index(start)
+    document = getattr(text_widget, 'document', None)
+    if document is None:
+        text = text_widget.get(start, stop)
+        return text, LineIndex(text, start), 0
+    base = document.index_to_offset(start)
+    stop = text_widget.index(stop)
+    # The document doesn't have the newline Tk keeps after the last line
+    stop = document.length() if text_widget.compare(stop, '>=', 'end-1c') else document.index_to_offset(stop)
+    return document.get(base, max(base, stop)), document, base
+
+
+def find_all_spans(pattern, text_widget, start="1.0", stop=tk.END):
+    """
+    A helper function that finds the start and end indexes of ALL matches of a Python regex within a text widget
+    The text is only copied out of the widget once and searched in a single pass. Matches are turned into indexes with
+    the widget's document (see document.PieceTable), so there are no further round trips to Tcl
+    """
+    text, line_index, base = _search_snapshot(text_widget, start, stop)
+    out = []
+    for match in pattern.finditer(text):
+        if match.start() == match.end():
+            continue
+        out.append((line_index.offset_to_index(base + match.start()), line_index.offset_to_index(base + match.end())))
+    return out
+
+
+def find_first_span(pattern, text_widget, start="1.0", stop=tk.END):
+    """
+    A helper function that finds the start and end index of the FIRST match of a Python regex within a text widget
+    """
+    text, line_index, base = _search_snapshot(text_widget, start, stop)
+    for match in pattern.finditer(text):
+        if match.start() != match.end():
+            return line_index.offset_to_index(base + match.start()), line_index.offset_to_index(base + match.end())
+    return None
+
+
+@profiling.timed('clear_tags')
 def clear_tags(tag, text_widget):
     """
     A helper function that clears a specified tag from within a text widget
     """
-    old_tags = []
-    ranges = text_widget.tag_ranges(tag)
-    for i in range(0, len(ranges), 2):
-        start = ranges[i]
-        stop = ranges[i + 1]
-        old_tags.append((tag, str(start), str(stop)))
-    for old_tag in old_tags:
-        text_widget.tag_remove(old_tag[0], old_tag[1], old_tag[2])
+    # A single call covering the whole text, rather than one per tagged range
+    text_widget.tag_remove(tag, "1.0", tk.END)
 
 
 def get_tags(start, end, text_obj):
@@ -64,3 +111,174 @@ def get_tags(start, end, text_obj):
         tags.extend((text_obj.tag_names(index)))
         index = text_obj.index(f"{index}+1c")
     return set(tags)
+
+
+def get_line_starts(text):
+    """
+    A helper function that returns the offsets that each line of text starts at
+    """
+    line_starts = [0]
+    newline = text.find('\n')
+    while newline != -1:
+        line_starts.append(newline + 1)
+        newline = text.find('\n', newline + 1)
+    return line_starts
+
+
+class LineIndex:
+    """
+    A table of the character offsets that each line of a text starts at. Used to convert offsets into a text that was
+    copied out of a text widget (e.g. from a regex match) to Tk's "line.col" indexes without searching the widget.
+    start is the index the text was copied from
+    """
+    def __init__(self, text="", start="1.0"):
+        self.line_starts = get_line_starts(text)
+        line, col = str(start).split('.')
+        self.first_line = int(line)
+        self.first_col = int(col)
+
+    def offset_to_index(self, offset):
+        line = bisect_right(self.line_starts, offset) - 1
+        col = offset - self.line_starts[line]
+        if line == 0:
+            col += self.first_col
+        return f"{self.first_line + line}.{col}"
+
+
+class TextTotals:
+    """
+    Line, word and character totals of a text widget, kept up to date from its edits (see editor.Editor) instead of
+    being recounted. The number of words on every line is stored, so an edit only needs to recount the lines it touched
+    """
+    def __init__(self, text_widget):
+        self.text_widget = text_widget
+        self.line_words = [0]
+        self.words = 0
+        self.chars = 0
+
+    def line_count(self):
+        return len(self.line_words)
+
+    def apply_edit(self, operation, start, end, text, start_offset, end_offset):
+        """
+        Edit listener (see editor.Editor.add_edit_listener())
+        """
+        first = int(start.split('.')[0])
+        last = int(end.split('.')[0])
+        if operation == 'insert':
+            self.chars += len(text)
+            old_words = self.line_words[first - 1]
+            lines = self.text_widget.get(f"{first}.0", f"{last}.end").split('\n')
+            counts = [len(line.split()) for line in lines]
+            self.line_words[first - 1:first] = counts
+        else:
+            self.chars -= end_offset - start_offset
+            old_words = sum(self.line_words[first - 1:last])
+            counts = [len(self.text_widget.get(f"{first}.0", f"{first}.end").split())]
+            self.line_words[first - 1:last] = counts
+        self.words += sum(counts) - old_words
+
+
+class SearchCache:
+    """
+    Caches search results per (query, no_case) for a text widget with a line index (see editor.Editor).
+
+    Results are kept as the offsets of every place the query occurs, overlapping ones included, so a query that
+    extends the previous one can be answered by narrowing the previous results down instead of scanning the whole
+    text again. Edits (passed in through apply_edit) only invalidate the lines they touched, which are rescanned the
+    next time the query is looked up
+    """
+    max_entries = 16
+
+    def __init__(self, text_widget):
+        self.text_widget = text_widget
+        # (query, no_case) -> [sorted match offsets, [start, end) offset ranges that need rescanning]
+        self._entries = {}
+        self._last_key = None
+
+    def clear(self):
+        self._entries = {}
+        self._last_key = None
+
+    def apply_edit(self, operation, start, end, text, start_offset, end_offset):
+        """
+        Edit listener (see editor.Editor.add_edit_listener())
+        """
+        document = self.text_widget.document
+        first_line = int(start.split('.')[0])
+        last_line = int(end.split('.')[0]) if operation == 'insert' else first_line
+        # The touched lines, as offsets after the edit
+        low = document.line_start(first_line)
+        high = document.line_start(last_line + 1) if last_line < document.line_count() else sys.maxsize
+        delta = len(text) if operation == 'insert' else start_offset - end_offset
+        high_before = high - delta if high != sys.maxsize else high
+        for (query, _), entry in self._entries.items():
+            starts, dirty = entry
+            # Matches can start a little before the touched lines and still run into them
+            entry_low = max(0, low - len(query) + 1)
+            first = bisect_left(starts, entry_low)
+            last = bisect_left(starts, high_before)
+            starts[first:] = [offset + delta for offset in starts[last:]]
+            for line_range in dirty:
+                for i in (0, 1):
+                    if line_range[i] >= high_before:
+                        line_range[i] += delta
+                    elif line_range[i] > entry_low:
+                        line_range[i] = entry_low
+            dirty.append([entry_low, high])
+
+    def _rescan(self, key, entry, text):
+        starts, dirty = entry
+        if not dirty:
+            return
+        query = key[0]
+        finder = re.compile(f"(?={re.escape(query)})", re.IGNORECASE if key[1] else 0)
+        for low, high in sorted(dirty):
+            found = [match.start() for match in finder.finditer(text, low, min(len(text), high + len(query) - 1))
+                     if match.start() < high]
+            first = bisect_left(starts, low)
+            last = bisect_left(starts, high)
+            starts[first:last] = found
+        entry[1] = []
+
+    def find(self, query, no_case=False, match_word=False, start="1.0"):
+        """
+        Finds the start and end indexes of ALL matches of query from start onwards, in the same way as
+        find_all_spans(compile_search(query, no_case=no_case, match_word=match_word), ...)
+        """
+        text = self.text_widget.document.text()
+        key = (query, bool(no_case))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._rescan(key, entry, text)
+        else:
+            last_key = self._last_key
+            last_entry = self._entries.get(last_key)
+            literal = compile_search(query, no_case=no_case)
+            if last_entry is not None and last_key[1] == key[1] and query.startswith(last_key[0]):
+                # Every match of the new query starts where the previous query matched
+                self._rescan(last_key, last_entry, text)
+                starts = [offset for offset in last_entry[0] if literal.match(text, offset)]
+            else:
+                finder = re.compile(f"(?={re.escape(query)})", re.IGNORECASE if no_case else 0)
+                starts = [match.start() for match in finder.finditer(text)]
+            entry = [starts, []]
+            self._entries[key] = entry
+            if len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        self._last_key = key
+
+        document = self.text_widget.document
+        pattern = compile_search(query, no_case=no_case, match_word=match_word)
+        starts = entry[0]
+        out = []
+        match_end = 0
+        for offset in starts[bisect_left(starts, document.index_to_offset(self.text_widget.index(start))):]:
+            if offset < match_end:
+                continue
+            match = pattern.match(text, offset)
+            if match is None or match.end() == offset:
+                continue
+            match_end = match.end()
+            out.append((document.offset_to_index(offset), document.offset_to_index(match_end)))
+        return out